@@ -0,0 +1,13 @@
+from bot.ar.index import TriggerIndex, normalize_trigger
+from bot.ar.templates import TemplateCache, CompiledTemplate, EmbedPlan, is_template
+from bot.ar.variables import MemberCounter, TemplateVariables, make_ordinal
+from bot.ar.matcher import PatternMatcher, MATCH_MODES, validate_pattern
+from bot.ar.sandbox import GuardedEnvironment, RenderLimitExceeded
+from bot.ar.responses import ResponseCache, RenderedResponse
+from bot.ar.outbox import SendQueue, SendQueueStats
+from bot.ar.cooldowns import (
+    CooldownTracker,
+    COOLDOWN_SCOPES,
+    MAX_COOLDOWN_RATE,
+    MAX_COOLDOWN_PER,
+)
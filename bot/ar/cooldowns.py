@@ -0,0 +1,109 @@
+import sys
+import time
+from array import array
+from datetime import timedelta
+from typing import Any, Dict, List, Tuple
+
+import discord
+
+from bot.cache import TimedCache
+from bot.exceptions import NonExistentEntry
+
+# What a cooldown can be per, i.e "user" means each user has their own window
+COOLDOWN_SCOPES = ("trigger", "user", "channel")
+# Each window holds ``rate`` timestamps and lives in the cache for ``per``
+MAX_COOLDOWN_RATE = 100
+MAX_COOLDOWN_PER = 24 * 60 * 60
+
+
+def get_cooldowns(ar: Dict[str, Any]) -> Dict[str, List[float]]:
+    """The cooldowns of an AR as ``{scope: [rate, per]}``"""
+    return ar.get("cooldowns") or {}
+
+
+def cooldown_target(scope: str, msg: discord.Message) -> int:
+    if scope == "user":
+        return msg.author.id
+    if scope == "channel":
+        return msg.channel.id
+    return 0
+
+
+class CooldownTracker:
+    """
+    Tracks when ARs last fired, to enforce their cooldowns.
+
+    Each (AR, scope, target) gets a sliding window which is a fixed
+    size ``array`` holding the last ``rate`` fire times as a ring,
+    so checking and recording a fire is O(1). Windows expire from the
+    cache once their cooldown has passed and the cache is bounded,
+    so idle users/channels don't hold on to any memory.
+
+    Parameters
+    ----------
+    max_size: int
+        How many windows to keep
+    """
+
+    __slots__ = ("cache",)
+
+    def __init__(self, max_size: int = 50_000):
+        self.cache: TimedCache = TimedCache(max_size=max_size)
+
+    def hit(self, guild_id: int, ar: Dict[str, Any], msg: discord.Message) -> bool:
+        """
+        Records a fire of an AR, unless it's on cooldown.
+
+        Parameters
+        ----------
+        guild_id: int
+            The guild the AR belongs to
+        ar: Dict[str, Any]
+            The AR which was triggered
+        msg: discord.Message
+            The msg which triggered it
+
+        Returns
+        -------
+        bool
+            True if the AR can fire, False if it's on cooldown
+        """
+        cooldowns = get_cooldowns(ar)
+        if not cooldowns:
+            return True
+
+        now = time.monotonic()
+        trigger = sys.intern(ar["trigger"])
+        windows: List[Tuple[Any, array, int, float]] = []
+        for scope, (rate, per) in cooldowns.items():
+            rate = int(rate)
+            if rate < 1:
+                continue
+
+            key = (guild_id, trigger, sys.intern(scope), cooldown_target(scope, msg))
+            window = self._window(key, rate)
+            # window[0] is the ring's head, the oldest fire time
+            head = int(window[0])
+            if window[head + 1] and now - window[head + 1] < per:
+                return False
+            windows.append((key, window, head, per))
+
+        # Only recorded once every scope allows it
+        for key, window, head, per in windows:
+            window[head + 1] = now
+            window[0] = (head + 1) % (len(window) - 1)
+            self.cache.add_entry(
+                key, window, ttl=timedelta(seconds=per), override=True
+            )
+
+        return True
+
+    def _window(self, key: Any, rate: int) -> array:
+        try:
+            window = self.cache.get_entry(key)
+        except NonExistentEntry:
+            window = None
+
+        if window is None or len(window) != rate + 1:
+            window = array("d", bytes(8 * (rate + 1)))
+        return window
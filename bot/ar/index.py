@@ -0,0 +1,176 @@
+import unicodedata
+from collections import Counter
+from typing import Any, Dict, Iterable, Optional
+
+
+def normalize_trigger(content: str) -> str:
+    """
+    Returns the case-insensitive matching key for a trigger or msg,
+    i.e NFKC normalized and casefolded so "Ｈｉ" and "hi" match.
+    """
+    return unicodedata.normalize("NFKC", content).casefold()
+
+
+class TriggerIndex:
+    """
+    A per guild hash index from trigger to AR,
+    so matching a msg costs a dict lookup.
+    Only ARs with the exact match mode are indexed.
+
+    ARs are always indexed by their exact trigger, those
+    with ``ignore_case?`` are also indexed by their normalized trigger.
+
+    The lengths of every indexed key are kept as well, which
+    lets most msgs be rejected before hashing or normalizing them.
+    """
+
+    __slots__ = ("_exact", "_folded", "_lengths")
+
+    def __init__(self):
+        self._exact: Dict[int, Dict[str, Dict[str, Any]]] = {}
+        self._folded: Dict[int, Dict[str, Dict[str, Any]]] = {}
+        self._lengths: Dict[int, Counter] = {}
+
+    def __contains__(self, guild_id: int) -> bool:
+        return guild_id in self._exact
+
+    def build(self, guild_id: int, ars: Iterable[Dict[str, Any]]) -> None:
+        """
+        (Re)builds the index for a guild.
+
+        Parameters
+        ----------
+        guild_id: int
+            The guild to index
+        ars: Iterable[Dict[str, Any]]
+            Every AR in said guild
+        """
+        self.drop(guild_id)
+        for ar in ars:
+            self.add(guild_id, ar)
+
+    def drop(self, guild_id: int) -> None:
+        self._exact.pop(guild_id, None)
+        self._folded.pop(guild_id, None)
+        self._lengths.pop(guild_id, None)
+
+    def add(self, guild_id: int, ar: Dict[str, Any]) -> None:
+        # Pattern triggers are handled by the PatternMatcher
+        if ar.get("match", "exact") != "exact":
+            return
+
+        lengths = self._lengths.setdefault(guild_id, Counter())
+        exact = self._exact.setdefault(guild_id, {})
+        if ar["trigger"] not in exact:
+            lengths[len(ar["trigger"])] += 1
+        exact[ar["trigger"]] = ar
+
+        if ar.get("ignore_case?"):
+            # The first AR to claim a normalized key keeps it
+            folded = self._folded.setdefault(guild_id, {})
+            key = normalize_trigger(ar["trigger"])
+            if key not in folded:
+                folded[key] = ar
+                lengths[len(key)] += 1
+
+    def remove(self, guild_id: int, ar: Dict[str, Any]) -> None:
+        exact = self._exact.get(guild_id)
+        if exact is None:
+            return
+
+        lengths = self._lengths[guild_id]
+        if exact.get(ar["trigger"]) is ar:
+            del exact[ar["trigger"]]
+            self._discard_length(lengths, len(ar["trigger"]))
+
+        folded = self._folded.get(guild_id)
+        if folded is not None:
+            key = normalize_trigger(ar["trigger"])
+            if folded.get(key) is ar:
+                del folded[key]
+                self._discard_length(lengths, len(key))
+                # Hand the key to another AR which normalizes the same
+                for other in exact.values():
+                    if other.get("ignore_case?") and normalize_trigger(
+                        other["trigger"]
+                    ) == key:
+                        folded[key] = other
+                        lengths[len(key)] += 1
+                        break
+
+            if not folded:
+                del self._folded[guild_id]
+
+        if not exact:
+            self.drop(guild_id)
+
+    @staticmethod
+    def _discard_length(lengths: Counter, length: int) -> None:
+        lengths[length] -= 1
+        if lengths[length] <= 0:
+            del lengths[length]
+
+    def might_match(self, guild_id: int, content: str) -> bool:
+        """
+        A cheap pre-filter, False means the msg definitely isn't a trigger.
+
+        Parameters
+        ----------
+        guild_id: int
+            The guild the msg was sent in
+        content: str
+            The content of the msg
+
+        Returns
+        -------
+        bool
+            Whether the msg needs a full lookup
+        """
+        lengths = self._lengths.get(guild_id)
+        if not lengths:
+            return False
+
+        if len(content) in lengths:
+            return True
+
+        # Normalizing ascii never changes its length, anything
+        # else could still match a case-insensitive trigger
+        return guild_id in self._folded and not content.isascii()
+
+    def get(self, guild_id: int, trigger: str) -> Optional[Dict[str, Any]]:
+        """
+        Returns the AR with this exact trigger, if any.
+        """
+        exact = self._exact.get(guild_id)
+        return exact.get(trigger) if exact else None
+
+    def lookup(self, guild_id: int, content: str) -> Optional[Dict[str, Any]]:
+        """
+        Returns the AR a msg triggers, if any.
+
+        Parameters
+        ----------
+        guild_id: int
+            The guild the msg was sent in
+        content: str
+            The content of the msg
+
+        Returns
+        -------
+        Optional[Dict[str, Any]]
+            The AR, exact matches win over case-insensitive ones
+        """
+        if not self.might_match(guild_id, content):
+            return None
+
+        exact = self._exact[guild_id]
+
+        ar = exact.get(content)
+        if ar is not None:
+            return ar
+
+        folded = self._folded.get(guild_id)
+        if folded:
+            return folded.get(normalize_trigger(content))
+
+        return None
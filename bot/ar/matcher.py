@@ -0,0 +1,366 @@
+import asyncio
+import fnmatch
+import logging
+import re
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import regex
+
+from bot.ar.index import normalize_trigger
+from bot.exceptions import InvalidPattern
+
+log = logging.getLogger(__name__)
+
+MATCH_MODES = ("exact", "startswith", "contains", "glob", "regex")
+LITERAL_MODES = ("startswith", "contains")
+
+# Longest msg content we run regex triggers against
+MAX_REGEX_INPUT = 2000
+
+# A group which is quantified and itself contains a quantifier,
+# i.e (a+)+ or (.*)* the classic catastrophic backtracking shapes
+_NESTED_QUANTIFIER = re.compile(r"\((?:[^()\\]|\\.)*[+*}](?:[^()\\]|\\.)*\)[+*{]")
+_BACKREFERENCE = re.compile(r"\\[1-9]|\(\?P=")
+# Flags like (?i) which apply to the whole pattern, rather than (?i:...)
+_GLOBAL_FLAGS = re.compile(r"(?<!\\)\(\?[aiLmsux]+\)")
+
+
+def match_mode(ar: Dict[str, Any]) -> str:
+    return ar.get("match", "exact")
+
+
+def branch_pattern(mode: str, trigger: str, ignore_case: bool = False) -> str:
+    """
+    The pattern a glob/regex trigger is matched with,
+    as it's combined with the guild's other pattern triggers.
+    """
+    if mode == "glob":
+        pattern = r"\A" + fnmatch.translate(trigger)
+    else:
+        pattern = trigger
+
+    if ignore_case:
+        pattern = f"(?i:{pattern})"
+    return pattern
+
+
+def validate_pattern(mode: str, trigger: str, ignore_case: bool = False) -> None:
+    """
+    Checks a trigger is usable with a match mode.
+
+    Parameters
+    ----------
+    mode: str
+        One of MATCH_MODES
+    trigger: str
+        The trigger of the AR
+    ignore_case: bool
+        Whether the trigger ignores case
+
+    Raises
+    ------
+    InvalidPattern
+        The mode is unknown or the trigger isn't a valid/safe pattern
+    """
+    if mode not in MATCH_MODES:
+        raise InvalidPattern(f"Unknown match mode `{mode}`.")
+
+    if mode in ("glob", "regex"):
+        compile_branch("ar0", mode, trigger, ignore_case)
+
+
+def compile_branch(
+    name: str, mode: str, trigger: str, ignore_case: bool = False
+) -> regex.Pattern:
+    """
+    Compiles a glob/regex trigger as the named branch it becomes
+    of the guild's combined pattern.
+
+    Raises
+    ------
+    InvalidPattern
+        The trigger isn't a valid/safe pattern
+    """
+    if mode == "regex":
+        if _GLOBAL_FLAGS.search(trigger):
+            raise InvalidPattern("Inline flags must be scoped, i.e `(?i:hello)`.")
+
+        # Each regex becomes one branch of a combined pattern,
+        # so they can't rely on their own group numbering/names
+        if _BACKREFERENCE.search(trigger):
+            raise InvalidPattern("Named groups and backreferences aren't supported.")
+
+        if _NESTED_QUANTIFIER.search(trigger):
+            raise InvalidPattern("Nested quantifiers like `(a+)+` aren't allowed.")
+
+    try:
+        compiled = regex.compile(
+            f"(?P<{name}>{branch_pattern(mode, trigger, ignore_case)})"
+        )
+    except regex.error as e:
+        raise InvalidPattern(f"Invalid regex: {e}")
+
+    if len(compiled.groupindex) > 1:
+        raise InvalidPattern("Named groups and backreferences aren't supported.")
+    return compiled
+
+
+class AhoCorasick:
+    """
+    An Aho–Corasick automaton, finds every occurrence of
+    any of its patterns in a single pass over the text.
+
+    Parameters
+    ----------
+    patterns: Iterable[Tuple[str, Any]]
+        The literal patterns, with the value to report for each
+    """
+
+    __slots__ = ("_goto", "_fail", "_out")
+
+    def __init__(self, patterns: Iterable[Tuple[str, Any]]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[Tuple[int, Any]]] = [[]]
+
+        for pattern, value in patterns:
+            if not pattern:
+                continue
+
+            state = 0
+            for char in pattern:
+                nxt = self._goto[state].get(char)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][char] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                state = nxt
+            self._out[state].append((len(pattern), value))
+
+        # Breadth first so a state's fail link is always resolved before it
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(char, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def __bool__(self) -> bool:
+        return len(self._goto) > 1
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, Any]]:
+        """
+        Yields
+        ------
+        Tuple[int, Any]
+            The start index of a match and the value of its pattern
+        """
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for i, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for length, value in out[state]:
+                yield i - length + 1, value
+
+
+class GuildMatcher:
+    """
+    The compiled pattern triggers of a guild.
+
+    Literal triggers (startswith/contains) share Aho–Corasick automatons,
+    one for exact case and one for case-insensitive triggers.
+    Glob and regex triggers are combined into one alternation.
+    """
+
+    __slots__ = ("_order", "_literals", "_folded", "_regex", "_regex_ars")
+
+    def __init__(self, ars: List[Dict[str, Any]]):
+        # Earlier ARs win when several match
+        self._order: Dict[int, int] = {id(ar): i for i, ar in enumerate(ars)}
+
+        literals = [ar for ar in ars if match_mode(ar) in LITERAL_MODES]
+        self._literals = AhoCorasick(
+            (ar["trigger"], ar) for ar in literals if not ar.get("ignore_case?")
+        )
+        self._folded = AhoCorasick(
+            (normalize_trigger(ar["trigger"]), ar)
+            for ar in literals
+            if ar.get("ignore_case?")
+        )
+
+        branches = []
+        self._regex_ars: Dict[str, Dict[str, Any]] = {}
+        for i, ar in enumerate(ars):
+            mode = match_mode(ar)
+            if mode not in ("glob", "regex"):
+                continue
+
+            name = f"ar{i}"
+            # Compiled on its own first so one bad trigger,
+            # i.e saved before validation got stricter, only disables itself
+            try:
+                compiled = compile_branch(
+                    name, mode, ar["trigger"], bool(ar.get("ignore_case?"))
+                )
+            except InvalidPattern as e:
+                log.warning("Skipping the pattern trigger %r: %s", ar["trigger"], e)
+                continue
+
+            branches.append(compiled.pattern)
+            self._regex_ars[name] = ar
+
+        self._regex: Optional[regex.Pattern] = None
+        if branches:
+            self._regex = regex.compile("|".join(branches))
+
+    @property
+    def has_regex(self) -> bool:
+        return self._regex is not None
+
+    def match_literals(self, content: str) -> Optional[Dict[str, Any]]:
+        best = None
+        for automaton, text in (
+            (self._literals, content),
+            (self._folded, normalize_trigger(content) if self._folded else ""),
+        ):
+            if not automaton:
+                continue
+
+            for start, ar in automaton.iter_matches(text):
+                if match_mode(ar) == "startswith" and start != 0:
+                    continue
+                if best is None or self._order[id(ar)] < self._order[id(best)]:
+                    best = ar
+
+        return best
+
+    def match_regex(
+        self, content: str, timeout: Optional[float] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Raises
+        ------
+        TimeoutError
+            The search took over ``timeout`` seconds
+        """
+        match = self._regex.search(content[:MAX_REGEX_INPUT], timeout=timeout)
+        return self._regex_ars[match.lastgroup] if match else None
+
+
+class PatternMatcher:
+    """
+    Matches msgs against the non-exact triggers of every guild.
+
+    Each guild's matcher is rebuilt lazily on the first msg after
+    its ARs change. Regex/glob triggers run in a worker thread with
+    the ``regex`` module, which releases the GIL while matching and
+    aborts a search once it runs over ``timeout``. A guild whose regexes
+    time out gets them disabled until its ARs change again, so one
+    bad pattern can't stall the bot.
+
+    Parameters
+    ----------
+    timeout: float
+        Seconds a regex search may take
+    """
+
+    __slots__ = ("timeout", "_ars", "_compiled", "_disabled", "_executor")
+
+    def __init__(self, timeout: float = 0.05):
+        self.timeout = timeout
+        self._ars: Dict[int, Dict[str, Dict[str, Any]]] = {}
+        self._compiled: Dict[int, GuildMatcher] = {}
+        self._disabled: Set[int] = set()
+        self._executor = ThreadPoolExecutor(
+            max_workers=2, thread_name_prefix="ar-regex"
+        )
+
+    def __contains__(self, guild_id: int) -> bool:
+        return guild_id in self._ars
+
+    def build(self, guild_id: int, ars: Iterable[Dict[str, Any]]) -> None:
+        self.drop(guild_id)
+        for ar in ars:
+            self.add(guild_id, ar)
+
+    def drop(self, guild_id: int) -> None:
+        self._ars.pop(guild_id, None)
+        self._invalidate(guild_id)
+
+    def add(self, guild_id: int, ar: Dict[str, Any]) -> None:
+        if match_mode(ar) == "exact":
+            return
+
+        self._ars.setdefault(guild_id, {})[ar["trigger"]] = ar
+        self._invalidate(guild_id)
+
+    def remove(self, guild_id: int, ar: Dict[str, Any]) -> None:
+        ars = self._ars.get(guild_id)
+        if not ars or ars.get(ar["trigger"]) is not ar:
+            return
+
+        del ars[ar["trigger"]]
+        if not ars:
+            del self._ars[guild_id]
+        self._invalidate(guild_id)
+
+    def get(self, guild_id: int, trigger: str) -> Optional[Dict[str, Any]]:
+        ars = self._ars.get(guild_id)
+        return ars.get(trigger) if ars else None
+
+    def _invalidate(self, guild_id: int) -> None:
+        self._compiled.pop(guild_id, None)
+        self._disabled.discard(guild_id)
+
+    async def match(self, guild_id: int, content: str) -> Optional[Dict[str, Any]]:
+        """
+        Parameters
+        ----------
+        guild_id: int
+            The guild the msg was sent in
+        content: str
+            The content of the msg
+
+        Returns
+        -------
+        Optional[Dict[str, Any]]
+            The AR triggered by the msg, literal triggers win over regexes
+        """
+        ars = self._ars.get(guild_id)
+        if not ars:
+            return None
+
+        matcher = self._compiled.get(guild_id)
+        if matcher is None:
+            matcher = self._compiled[guild_id] = GuildMatcher(list(ars.values()))
+
+        ar = matcher.match_literals(content)
+        if ar is not None or not matcher.has_regex or guild_id in self._disabled:
+            return ar
+
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(
+                self._executor, matcher.match_regex, content, self.timeout
+            )
+        except TimeoutError:
+            log.warning(
+                "Regex triggers in guild %s took over %ss, disabling them",
+                guild_id,
+                self.timeout,
+            )
+            self._disabled.add(guild_id)
+            return None
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,223 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+import attr
+import discord
+from aiolimiter import AsyncLimiter
+
+log = logging.getLogger(__name__)
+
+
+@attr.s(slots=True)
+class PendingSend:
+    channel: discord.abc.Messageable = attr.ib()
+    # What the response is for, i.e the trigger, used to collapse duplicates
+    key: Any = attr.ib()
+    content: Optional[str] = attr.ib()
+    embed: Optional[discord.Embed] = attr.ib()
+
+    def same_as(self, other: "PendingSend") -> bool:
+        return (
+            self.key == other.key
+            and self.content == other.content
+            and self.embed == other.embed
+        )
+
+
+@attr.s(slots=True)
+class SendQueueStats:
+    depth: int = attr.ib(default=0)
+    channels: int = attr.ib(default=0)
+    sent: int = attr.ib(default=0)
+    collapsed: int = attr.ib(default=0)
+    dropped: int = attr.ib(default=0)
+    failed: int = attr.ib(default=0)
+
+
+class _ChannelQueue:
+    __slots__ = ("guild_id", "pending", "limiter", "worker", "wakeup")
+
+    def __init__(self, guild_id: int, limiter: AsyncLimiter):
+        self.guild_id = guild_id
+        self.pending: Deque[PendingSend] = deque()
+        self.limiter = limiter
+        self.worker: Optional[asyncio.Task] = None
+        self.wakeup = asyncio.Event()
+
+
+class SendQueue:
+    """
+    Outbound queue for AR responses, rate limited per channel and per guild.
+
+    Each channel with pending sends gets its own worker task which waits
+    on that channel's and guild's token buckets, so a guild spamming
+    triggers only ever delays its own responses and never sleeps
+    on discord.py's rate limit handling.
+
+    While the buckets can't cover what's already waiting, a response
+    identical to one waiting in the channel is collapsed into it, and anything past
+    ``max_pending`` per channel is dropped.
+
+    Parameters
+    ----------
+    channel_rate: Tuple[float, float]
+        Sends allowed per channel, as (amount, seconds)
+    guild_rate: Tuple[float, float]
+        Sends allowed per guild, as (amount, seconds)
+    max_pending: int
+        How many sends a channel can have waiting
+    """
+
+    __slots__ = (
+        "channel_rate",
+        "guild_rate",
+        "max_pending",
+        "_channels",
+        "_guild_limiters",
+        "_stats",
+    )
+
+    def __init__(
+        self,
+        channel_rate: Tuple[float, float] = (5, 5),
+        guild_rate: Tuple[float, float] = (10, 5),
+        max_pending: int = 5,
+    ):
+        self.channel_rate = channel_rate
+        self.guild_rate = guild_rate
+        self.max_pending = max_pending
+        self._channels: Dict[int, _ChannelQueue] = {}
+        self._guild_limiters: Dict[int, AsyncLimiter] = {}
+        self._stats = SendQueueStats()
+
+    def put(
+        self,
+        guild_id: int,
+        channel: discord.abc.Messageable,
+        key: Any,
+        content: Optional[str] = None,
+        embed: Optional[discord.Embed] = None,
+    ) -> bool:
+        """
+        Queues a response to be sent.
+
+        Parameters
+        ----------
+        guild_id: int
+            The guild the channel is in
+        channel: discord.abc.Messageable
+            Where to send the response
+        key: Any
+            What the response is for, i.e the trigger
+        content: Optional[str]
+            The text to send
+        embed: Optional[discord.Embed]
+            The embed to send
+
+        Returns
+        -------
+        bool
+            Whether it was queued, False if it was collapsed or dropped
+        """
+        send = PendingSend(channel=channel, key=key, content=content, embed=embed)
+        queue = self._channels.get(channel.id)
+        if queue is None:
+            queue = self._channels[channel.id] = _ChannelQueue(
+                guild_id, AsyncLimiter(*self.channel_rate)
+            )
+
+        if queue.pending:
+            # Whether the buckets can't cover what's waiting plus this send
+            needed = len(queue.pending) + 1
+            limiter = self._guild_limiter(guild_id)
+            if not (
+                queue.limiter.has_capacity(needed) and limiter.has_capacity(needed)
+            ):
+                if any(send.same_as(pending) for pending in queue.pending):
+                    self._stats.collapsed += 1
+                    return False
+
+            if len(queue.pending) >= self.max_pending:
+                self._stats.dropped += 1
+                return False
+
+        queue.pending.append(send)
+        if queue.worker is None:
+            queue.worker = asyncio.create_task(self._drain(channel.id, queue))
+        else:
+            queue.wakeup.set()
+        return True
+
+    def depth(self, guild_id: Optional[int] = None) -> int:
+        """
+        Parameters
+        ----------
+        guild_id: Optional[int]
+            Only count sends waiting in this guild
+
+        Returns
+        -------
+        int
+            How many sends are waiting
+        """
+        return sum(
+            len(queue.pending)
+            for queue in self._channels.values()
+            if guild_id is None or queue.guild_id == guild_id
+        )
+
+    def get_stats(self) -> SendQueueStats:
+        stats = self._stats
+        return SendQueueStats(
+            depth=self.depth(),
+            channels=len(self._channels),
+            sent=stats.sent,
+            collapsed=stats.collapsed,
+            dropped=stats.dropped,
+            failed=stats.failed,
+        )
+
+    def close(self) -> None:
+        for queue in self._channels.values():
+            if queue.worker:
+                queue.worker.cancel()
+        self._channels.clear()
+        self._guild_limiters.clear()
+
+    def _guild_limiter(self, guild_id: int) -> AsyncLimiter:
+        limiter = self._guild_limiters.get(guild_id)
+        if limiter is None:
+            limiter = self._guild_limiters[guild_id] = AsyncLimiter(*self.guild_rate)
+        return limiter
+
+    async def _drain(self, channel_id: int, queue: _ChannelQueue) -> None:
+        try:
+            while True:
+                while queue.pending:
+                    await self._guild_limiter(queue.guild_id).acquire()
+                    await queue.limiter.acquire()
+                    # Kept at the front while waiting so duplicates collapse into it
+                    send = queue.pending.popleft()
+                    try:
+                        await send.channel.send(send.content, embed=send.embed)
+                    except discord.HTTPException as e:
+                        self._stats.failed += 1
+                        log.debug("Failed to send AR response in %s: %s", channel_id, e)
+                    else:
+                        self._stats.sent += 1
+
+                # Linger until the bucket has drained, forgetting it sooner
+                # would give a burst right after a fresh allowance
+                queue.wakeup.clear()
+                try:
+                    await asyncio.wait_for(queue.wakeup.wait(), self.channel_rate[1])
+                except asyncio.TimeoutError:
+                    if not queue.pending:
+                        break
+        finally:
+            if self._channels.get(channel_id) is queue:
+                del self._channels[channel_id]
+            if not any(q.guild_id == queue.guild_id for q in self._channels.values()):
+                self._guild_limiters.pop(queue.guild_id, None)
@@ -0,0 +1,131 @@
+from typing import Optional
+
+import attr
+import discord
+
+from bot.ar.variables import MemberCounter, TemplateVariables
+from bot.cache import TimedCache
+from bot.exceptions import NonExistentEntry
+
+# Responses only using these render the same for everyone in a guild
+GUILD_VARIABLES = frozenset({"guild_name", "guild_id", "guild_mc", "guild_mc_ord"})
+
+
+@attr.s(slots=True)
+class RenderedResponse:
+    content: Optional[str] = attr.ib()
+    embed: Optional[discord.Embed] = attr.ib()
+    # What the response was rendered with, to tell when it went stale
+    guild_name: str = attr.ib()
+    member_count: Optional[int] = attr.ib(default=None)
+
+
+class ResponseCache:
+    """
+    A bounded cache of fully rendered AR responses, per guild and trigger.
+
+    Only responses whose templates use nothing but guild level
+    variables are cached, anything per user or per msg is rendered each time.
+    Neither are responses whose render fell back to the template source
+    or which are random, i.e use the random filter.
+
+    Parameters
+    ----------
+    max_size: int
+        How many responses to keep
+    member_threshold: int
+        How far the member count may drift before
+        a response using it gets re-rendered
+    """
+
+    __slots__ = ("cache", "member_threshold")
+
+    def __init__(self, max_size: int = 4096, member_threshold: int = 5):
+        self.cache: TimedCache = TimedCache(max_size=max_size)
+        self.member_threshold = member_threshold
+
+    def get(
+        self, guild: discord.Guild, trigger: str, members: MemberCounter
+    ) -> Optional[RenderedResponse]:
+        """
+        Returns the cached response for an AR, if it's still fresh.
+
+        Parameters
+        ----------
+        guild: discord.Guild
+            The guild the AR was triggered in
+        trigger: str
+            The trigger of the AR
+        members: MemberCounter
+            Used to check responses using the member count
+
+        Returns
+        -------
+        Optional[RenderedResponse]
+            The response, None if it has to be rendered
+        """
+        key = (guild.id, trigger)
+        try:
+            response: RenderedResponse = self.cache.get_entry(key)
+        except NonExistentEntry:
+            return None
+
+        # Checked here so renames/joins don't need to touch the cache
+        if response.guild_name != guild.name or (
+            response.member_count is not None
+            and abs(members.get(guild) - response.member_count)
+            >= self.member_threshold
+        ):
+            self.cache.delete_entry(key)
+            return None
+
+        return response
+
+    def put(
+        self,
+        guild: discord.Guild,
+        trigger: str,
+        variables: TemplateVariables,
+        content: Optional[str] = None,
+        embed: Optional[discord.Embed] = None,
+    ) -> RenderedResponse:
+        """
+        Wraps a freshly rendered response, caching it if it's cacheable.
+
+        Parameters
+        ----------
+        guild: discord.Guild
+            The guild the AR was triggered in
+        trigger: str
+            The trigger of the AR
+        variables: TemplateVariables
+            The variables the response was rendered with
+        content: Optional[str]
+            The rendered text
+        embed: Optional[discord.Embed]
+            The rendered embed
+
+        Returns
+        -------
+        RenderedResponse
+            The response
+        """
+        used = variables.values.keys()
+        member_count = None
+        if "guild_mc" in used or "guild_mc_ord" in used:
+            member_count = variables.members.get(guild)
+
+        response = RenderedResponse(
+            content=content,
+            embed=embed,
+            guild_name=guild.name,
+            member_count=member_count,
+        )
+
+        if used <= GUILD_VARIABLES and variables.cacheable:
+            self.cache.add_entry((guild.id, trigger), response, override=True)
+
+        return response
+
+    def invalidate(self, guild_id: int, trigger: str) -> None:
+        self.cache.delete_entry((guild_id, trigger))
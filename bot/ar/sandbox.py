@@ -0,0 +1,368 @@
+import functools
+import operator
+import re
+import string
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, Optional
+
+import jinja2
+import jinja2.sandbox
+from jinja2.compiler import CodeGenerator
+from jinja2.exceptions import SecurityError
+from jinja2.utils import generate_lorem_ipsum
+
+
+class RenderLimitExceeded(SecurityError):
+    """A template went over one of the render limits."""
+
+
+class _Budget:
+    __slots__ = ("deadline", "steps", "max_steps")
+
+    def __init__(self, deadline: float, max_steps: int):
+        self.deadline = deadline
+        self.steps = 0
+        self.max_steps = max_steps
+
+    def tick(self) -> None:
+        self.steps += 1
+        if self.steps > self.max_steps:
+            raise RenderLimitExceeded("Template did too many iterations.")
+        # Checking the clock every step would cost more than the step
+        if not self.steps & 63 and time.perf_counter() > self.deadline:
+            raise RenderLimitExceeded("Template took too long to render.")
+
+
+# The width/precision of a printf style conversion
+_PRINTF_SIZE = re.compile(r"%(?:\([^)]*\))?[-#0 +]*(\*|\d*)(?:\.(\*|\d*))?")
+
+# str methods which pad their result out to a width
+_PADDING_METHODS = frozenset(["ljust", "rjust", "center", "zfill"])
+
+# Renders may run on worker threads, each tracks its own budget
+_state = threading.local()
+
+
+def _tick() -> None:
+    budget = getattr(_state, "budget", None)
+    if budget is not None:
+        budget.tick()
+
+
+def _is_int(value: Any) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+class GuardedCodeGenerator(CodeGenerator):
+    """Routes ``~`` through the environment so the result's size is checked."""
+
+    def visit_Concat(self, node, frame) -> None:
+        self.write("environment.check_size(")
+        super().visit_Concat(node, frame)
+        self.write(")")
+
+
+class GuardedRange:
+    """A range which is size capped and counts its iterations against the budget."""
+
+    __slots__ = ("_range",)
+
+    def __init__(self, rng: range):
+        self._range = rng
+
+    def __len__(self) -> int:
+        return len(self._range)
+
+    def __getitem__(self, item):
+        return self._range[item]
+
+    def __iter__(self) -> Iterator[int]:
+        for i in self._range:
+            _tick()
+            yield i
+
+
+class GuardedEnvironment(jinja2.sandbox.SandboxedEnvironment):
+    """
+    A sandbox which also bounds the resources a template can use.
+
+    Parameters
+    ----------
+    max_range: int
+        The largest range a template can create
+    max_iterations: int
+        How many loop iterations/calls a single render can do
+    max_output: int
+        The most characters a render can output
+    time_budget: float
+        Seconds a single render can take
+    max_int_bits: int
+        The largest int, in bits, arithmetic can produce
+
+    Notes
+    -----
+    Going over any limit raises RenderLimitExceeded,
+    which is a jinja2.TemplateError.
+
+    Arithmetic, padding and the like are a single C call which never
+    comes back to check the time budget, so the size of a result is
+    estimated and checked before it's computed. Anything which can
+    only grow by combining existing values, i.e ``~``, ``+`` or
+    ``join``, is checked right after instead.
+    """
+
+    code_generator_class = GuardedCodeGenerator
+    intercepted_binops = frozenset(["*", "**", "%", "+"])
+
+    def __init__(
+        self,
+        *args: Any,
+        max_range: int = 1000,
+        max_iterations: int = 10_000,
+        max_output: int = 4096,
+        time_budget: float = 0.05,
+        max_int_bits: int = 4096,
+        **kwargs: Any,
+    ):
+        super().__init__(*args, **kwargs)
+        self.max_range = max_range
+        self.max_iterations = max_iterations
+        self.max_output = max_output
+        self.time_budget = time_budget
+        self.max_int_bits = max_int_bits
+        self.globals["range"] = self.guarded_range
+        self.globals["lipsum"] = self.guarded_lipsum
+        self.filters = {
+            name: self._guard_filter(name, func) for name, func in self.filters.items()
+        }
+
+    def guarded_range(self, *args: int) -> GuardedRange:
+        rng = range(*args)
+        if len(rng) > self.max_range:
+            raise RenderLimitExceeded(f"Ranges are capped at {self.max_range} items.")
+        return GuardedRange(rng)
+
+    def guarded_lipsum(
+        self, n: int = 5, html: bool = True, min: int = 20, max: int = 100
+    ) -> str:
+        if n > 5 or max > 100:
+            raise RenderLimitExceeded("lipsum is capped at 5 paragraphs of 100 words.")
+        return generate_lorem_ipsum(n, html, min, max)
+
+    def check_size(self, value: Any) -> Any:
+        """Raises RenderLimitExceeded if a str/container is over ``max_output``."""
+        if (
+            isinstance(value, (str, list, tuple, dict, set))
+            and len(value) > self.max_output
+        ):
+            raise RenderLimitExceeded(
+                f"Values are capped at {self.max_output} characters/items."
+            )
+        return value
+
+    def call(__self, __context, __obj, *args: Any, **kwargs: Any) -> Any:
+        _tick()
+        bound = getattr(__obj, "__self__", None)
+        if isinstance(bound, str):
+            __self._check_str_method(bound, __obj.__name__, args, kwargs)
+
+        result = super().call(__context, __obj, *args, **kwargs)
+        # i.e list.extend can grow the list it's bound to
+        __self.check_size(bound)
+        return __self.check_size(result)
+
+    def call_binop(self, context, operator_: str, left: Any, right: Any) -> Any:
+        _tick()
+        if operator_ == "**":
+            self._check_pow(left, right)
+            return operator.pow(left, right)
+
+        if operator_ == "%":
+            if isinstance(left, str):
+                self._check_printf(left)
+            return self.check_size(operator.mod(left, right))
+
+        if operator_ == "+":
+            self._check_add(left, right)
+            return operator.add(left, right)
+
+        self._check_mul(left, right)
+        return operator.mul(left, right)
+
+    def _check_add(self, left: Any, right: Any) -> None:
+        sequences = (str, list, tuple)
+        if isinstance(left, sequences) and isinstance(right, sequences):
+            self.check_size(left)
+            self.check_size(right)
+            if len(left) + len(right) > self.max_output:
+                raise RenderLimitExceeded("Concatenation too large.")
+
+    def _check_mul(self, left: Any, right: Any) -> None:
+        if _is_int(left) and _is_int(right):
+            if left.bit_length() + right.bit_length() > self.max_int_bits:
+                raise RenderLimitExceeded("Product too large.")
+
+        # Repeating a str/list is the easy way to eat memory
+        for seq, times in ((left, right), (right, left)):
+            if isinstance(seq, (str, list, tuple)) and _is_int(times):
+                if len(seq) * times > self.max_output:
+                    raise RenderLimitExceeded("Repeated sequence too large.")
+
+    def wrap_str_format(self, value: Any) -> Optional[Callable[..., str]]:
+        wrapper = super().wrap_str_format(value)
+        if wrapper is None:
+            return None
+
+        fmt = value.__self__
+
+        @functools.wraps(wrapper)
+        def guarded(*args: Any, **kwargs: Any) -> str:
+            _tick()
+            self._check_format(fmt)
+            return self.check_size(wrapper(*args, **kwargs))
+
+        return guarded
+
+    def _guard_filter(self, name: str, func: Callable[..., Any]) -> Callable[..., Any]:
+        check = getattr(self, f"_check_{name}_filter", None)
+        # Filters marked pass_context/pass_eval_context (async variants
+        # included) get it as their first argument, the checks don't
+        passes_arg = getattr(func, "jinja_pass_arg", None) is not None
+
+        # Keeps the pass_context/pass_eval_context marker of the filter
+        @functools.wraps(func)
+        def guarded(*args: Any, **kwargs: Any) -> Any:
+            _tick()
+            if check is not None:
+                check(*args[passes_arg:], **kwargs)
+            return self.check_size(func(*args, **kwargs))
+
+        return guarded
+
+    def _check_width(self, width: Any) -> None:
+        if _is_int(width) and width > self.max_output:
+            raise RenderLimitExceeded(f"Widths are capped at {self.max_output}.")
+
+    def _check_replace(self, text: str, old: Any, new: Any, count: Any = -1) -> None:
+        if not isinstance(old, str) or not isinstance(new, str):
+            return
+
+        found = text.count(old)
+        if _is_int(count) and count >= 0:
+            found = min(found, count)
+        if len(text) + found * (len(new) - len(old)) > self.max_output:
+            raise RenderLimitExceeded("Replaced text too large.")
+
+    def _check_str_method(
+        self, text: str, name: str, args: tuple, kwargs: Dict[str, Any]
+    ) -> None:
+        if name in _PADDING_METHODS and args:
+            self._check_width(args[0])
+        elif name == "expandtabs":
+            tabsize = args[0] if args else kwargs.get("tabsize", 8)
+            if _is_int(tabsize):
+                self._check_width(len(text) + text.count("\t") * tabsize)
+        elif name == "replace" and len(args) >= 2:
+            self._check_replace(text, *args[:3])
+
+    # The signatures match the filters they check
+    def _check_center_filter(self, value: Any, width: Any = 80) -> None:
+        self._check_width(width)
+
+    def _check_indent_filter(
+        self, s: Any, width: Any = 4, first: bool = False, blank: bool = False
+    ) -> None:
+        if isinstance(width, str):
+            width = len(width)
+        if _is_int(width):
+            self._check_width((str(s).count("\n") + 1) * width)
+
+    def _check_format_filter(self, value: Any, *args: Any, **kwargs: Any) -> None:
+        self._check_printf(str(value))
+
+    def _check_replace_filter(
+        self, s: Any, old: Any, new: Any, count: Any = None
+    ) -> None:
+        self._check_replace(str(s), old, new, -1 if count is None else count)
+
+    def _check_batch_filter(
+        self, value: Any, linecount: Any, fill_with: Any = None
+    ) -> None:
+        # The last batch gets padded out to linecount
+        if fill_with is not None:
+            self._check_width(linecount)
+
+    def _check_slice_filter(
+        self, value: Any, slices: Any, fill_with: Any = None
+    ) -> None:
+        if _is_int(slices) and slices > self.max_range:
+            raise RenderLimitExceeded(f"Slices are capped at {self.max_range}.")
+
+    def _check_pow(self, left: Any, right: Any) -> None:
+        if not (_is_int(left) and _is_int(right)):
+            # Float powers overflow rather than grow
+            return
+
+        if right < 0 or left in (-1, 0, 1):
+            return
+
+        if left.bit_length() * right > self.max_int_bits:
+            raise RenderLimitExceeded("Power too large.")
+
+    def _check_printf(self, fmt: str) -> None:
+        # i.e "%0999999999d" pads the result to a GB
+        for match in _PRINTF_SIZE.finditer(fmt):
+            for size in match.groups():
+                if size == "*" or (size and int(size) > self.max_output):
+                    raise RenderLimitExceeded("Format width too large.")
+
+    def _check_format(self, fmt: str) -> None:
+        # i.e "{:>999999999}" pads the result to a GB
+        for _, _, spec, _ in string.Formatter().parse(fmt):
+            if not spec:
+                continue
+            if "{" in spec:
+                raise RenderLimitExceeded("Nested format specs aren't supported.")
+            for size in re.findall(r"\d+", spec):
+                if int(size) > self.max_output:
+                    raise RenderLimitExceeded("Format width too large.")
+
+    def render(self, template: jinja2.Template, variables: Dict[str, Any]) -> str:
+        """
+        Render a template of this environment within the limits.
+
+        Parameters
+        ----------
+        template: jinja2.Template
+            The template to render
+        variables: Dict[str, Any]
+            What to render it with
+
+        Returns
+        -------
+        str
+            The rendered text
+
+        Raises
+        ------
+        RenderLimitExceeded
+            The template went over a limit
+        """
+        _state.budget = _Budget(
+            time.perf_counter() + self.time_budget, self.max_iterations
+        )
+        try:
+            chunks = []
+            size = 0
+            for chunk in template.generate(variables):
+                size += len(chunk)
+                if size > self.max_output:
+                    raise RenderLimitExceeded(
+                        f"Output is capped at {self.max_output} characters."
+                    )
+                _tick()
+                chunks.append(chunk)
+            return "".join(chunks)
+        finally:
+            _state.budget = None
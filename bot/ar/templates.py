@@ -0,0 +1,275 @@
+from typing import Any, Dict, FrozenSet, Iterator, List, Optional, Tuple, Union
+
+import attr
+import jinja2
+import jinja2.meta
+import jinja2.sandbox
+from jinja2 import nodes
+
+from bot.cache import TimedCache
+from bot.exceptions import NonExistentEntry
+
+
+EXPENSIVE_NODES = (nodes.For, nodes.Macro, nodes.CallBlock)
+# Globals, filters and methods which do a lot of work in one call
+EXPENSIVE_CALLS = frozenset(
+    {
+        "lipsum",
+        "format",
+        "format_map",
+        "ljust",
+        "rjust",
+        "center",
+        "zfill",
+        "expandtabs",
+        "replace",
+        "join",
+    }
+)
+# Globals and filters which render differently every time
+RANDOM_CALLS = frozenset({"lipsum", "cycler", "joiner"})
+RANDOM_FILTERS = frozenset({"random"})
+EXPENSIVE_FILTERS = frozenset(
+    {"center", "indent", "format", "replace", "join", "wordwrap", "batch", "slice"}
+)
+TEMPLATE_MARKERS = ("{{", "{%", "{#")
+
+Path = Tuple[Union[str, int], ...]
+
+
+def is_template(text: Any) -> bool:
+    """Whether the text contains any template syntax at all."""
+    return isinstance(text, str) and any(m in text for m in TEMPLATE_MARKERS)
+
+
+def _called_names(ast: nodes.Template) -> Iterator[str]:
+    for call in ast.find_all(nodes.Call):
+        func = call.node
+        name = getattr(func, "name", None) or getattr(func, "attr", None)
+        if name:
+            yield name
+
+
+def is_deterministic(ast: nodes.Template) -> bool:
+    """Whether a template renders the same every time for the same variables."""
+    if any(node.name in RANDOM_FILTERS for node in ast.find_all(nodes.Filter)):
+        return False
+    return not any(name in RANDOM_CALLS for name in _called_names(ast))
+
+
+def is_expensive(ast: nodes.Template) -> bool:
+    """Whether rendering a template may take long enough to be worth offloading."""
+    if ast.find(EXPENSIVE_NODES) is not None:
+        return True
+
+    if any(node.name in EXPENSIVE_FILTERS for node in ast.find_all(nodes.Filter)):
+        return True
+
+    return any(name in EXPENSIVE_CALLS for name in _called_names(ast))
+
+
+@attr.s(slots=True)
+class CompiledTemplate:
+    template: jinja2.Template = attr.ib()
+    # The undeclared variables the template references
+    variables: FrozenSet[str] = attr.ib()
+    # Loops/macros and heavy calls can make a render slow
+    expensive: bool = attr.ib(default=False)
+    # Whether it renders the same every time for the same variables
+    deterministic: bool = attr.ib(default=True)
+
+
+@attr.s(slots=True)
+class EmbedPlan:
+    """
+    An embed response compiled once, the stored embed dict
+    plus the slots within it which hold templates.
+    """
+
+    base: Dict[str, Any] = attr.ib()
+    # (path to the slot, its source, its template)
+    slots: List[Tuple[Path, str, CompiledTemplate]] = attr.ib(factory=list)
+
+    def fill(self, values: List[Tuple[Path, Any]]) -> Dict[str, Any]:
+        """
+        Returns a copy of the base embed dict with the given slots
+        replaced, only the containers along those paths are copied.
+
+        Parameters
+        ----------
+        values: List[Tuple[Path, Any]]
+            The rendered value for each path
+
+        Returns
+        -------
+        Dict[str, Any]
+            The filled in embed dict
+        """
+        if not values:
+            return self.base
+
+        root = dict(self.base)
+        copied = {id(root)}
+        for path, value in values:
+            node = root
+            for key in path[:-1]:
+                child = node[key]
+                if id(child) not in copied:
+                    child = list(child) if isinstance(child, list) else dict(child)
+                    copied.add(id(child))
+                    node[key] = child
+                node = child
+            node[path[-1]] = value
+
+        return root
+
+
+def embed_value(embed: Dict[str, Any], path: Path) -> Any:
+    """The value at a path of an embed dict, None if it doesn't have it."""
+    node: Any = embed
+    for part in path:
+        try:
+            node = node[part]
+        except (KeyError, IndexError, TypeError):
+            return None
+    return node
+
+
+def embed_paths(embed: Dict[str, Any]) -> List[Path]:
+    """The paths of the text in an embed dict which can be templated."""
+    paths = [("title",), ("description",), ("footer", "text"), ("author", "name")]
+    for i, _ in enumerate(embed.get("fields", ())):
+        paths.append(("fields", i, "name"))
+        paths.append(("fields", i, "value"))
+    return paths
+
+
+class TemplateCache:
+    """
+    A bounded cache of compiled AR templates, keyed by
+    guild and trigger, then by the field of the response.
+
+    Parameters
+    ----------
+    env: jinja2.sandbox.SandboxedEnvironment
+        The environment to compile templates with
+    max_size: int
+        How many ARs to keep compiled templates for
+    """
+
+    __slots__ = ("env", "cache")
+
+    def __init__(
+        self, env: jinja2.sandbox.SandboxedEnvironment, max_size: int = 2048
+    ):
+        self.env = env
+        self.cache: TimedCache = TimedCache(max_size=max_size)
+
+    def get(
+        self, guild_id: int, trigger: str, field: str, source: str
+    ) -> Optional[CompiledTemplate]:
+        """
+        Returns the compiled template for a field of an AR,
+        compiling, analyzing and caching it on a miss.
+
+        Parameters
+        ----------
+        guild_id: int
+            The guild the AR belongs to
+        trigger: str
+            The trigger of the AR
+        field: str
+            Which part of the response this is, i.e "description"
+        source: str
+            The template source, if it changed since it was
+            cached the template is recompiled
+
+        Returns
+        -------
+        Optional[CompiledTemplate]
+            The template, None if the source isn't a valid template
+        """
+        key = (guild_id, trigger)
+        try:
+            fields: Dict[
+                str, Tuple[str, Optional[CompiledTemplate]]
+            ] = self.cache.get_entry(key)
+        except NonExistentEntry:
+            fields = {}
+            self.cache.add_entry(key, fields)
+
+        try:
+            cached_source, template = fields[field]
+        except KeyError:
+            pass
+        else:
+            if cached_source == source:
+                return template
+
+        try:
+            ast = self.env.parse(source)
+            template = CompiledTemplate(
+                template=self.env.from_string(ast),
+                variables=frozenset(jinja2.meta.find_undeclared_variables(ast)),
+                expensive=is_expensive(ast),
+                deterministic=is_deterministic(ast),
+            )
+        except jinja2.TemplateError:
+            # Cached as well so broken templates aren't re-parsed every time
+            template = None
+
+        fields[field] = (source, template)
+        return template
+
+    def embed_plan(
+        self, guild_id: int, trigger: str, embed: Dict[str, Any]
+    ) -> EmbedPlan:
+        """
+        Returns the render plan for an embed AR,
+        building and caching it on a miss.
+
+        Parameters
+        ----------
+        guild_id: int
+            The guild the AR belongs to
+        trigger: str
+            The trigger of the AR
+        embed: Dict[str, Any]
+            The stored embed dict
+
+        Returns
+        -------
+        EmbedPlan
+            The plan, only slots holding valid templates are included
+        """
+        key = (guild_id, trigger)
+        try:
+            fields = self.cache.get_entry(key)
+        except NonExistentEntry:
+            fields = {}
+            self.cache.add_entry(key, fields)
+
+        try:
+            cached_embed, plan = fields["embed"]
+        except KeyError:
+            pass
+        else:
+            if cached_embed is embed or cached_embed == embed:
+                return plan
+
+        plan = EmbedPlan(base=embed)
+        for path in embed_paths(embed):
+            node = embed_value(embed, path)
+            if not is_template(node):
+                continue
+
+            compiled = self.get(guild_id, trigger, ".".join(map(str, path)), node)
+            if compiled is not None:
+                plan.slots.append((path, node, compiled))
+
+        fields["embed"] = (embed, plan)
+        return plan
+
+    def invalidate(self, guild_id: int, trigger: str) -> None:
+        """Drops every compiled template of an AR."""
+        self.cache.delete_entry((guild_id, trigger))
@@ -0,0 +1,100 @@
+from typing import Any, Callable, Dict, Iterable
+
+import discord
+
+
+def make_ordinal(n: int) -> str:
+    """
+    Convert an integer into its ordinal representation::
+
+        make_ordinal(0)   => '0th'
+        make_ordinal(3)   => '3rd'
+        make_ordinal(122) => '122nd'
+        make_ordinal(213) => '213th'
+    """
+    n = int(n)
+    if 11 <= (n % 100) <= 13:
+        suffix = "th"
+    else:
+        suffix = ["th", "st", "nd", "rd", "th"][min(n % 10, 4)]
+    return str(n) + suffix
+
+
+class MemberCounter:
+    """
+    Non-bot member counts per guild, kept up to date from
+    member join/leave events rather than scanning members.
+
+    A guild is only scanned once, the first time its count is needed.
+    """
+
+    __slots__ = ("counts",)
+
+    def __init__(self):
+        self.counts: Dict[int, int] = {}
+
+    def get(self, guild: discord.Guild) -> int:
+        try:
+            return self.counts[guild.id]
+        except KeyError:
+            count = sum(not member.bot for member in guild.members)
+            self.counts[guild.id] = count
+            return count
+
+    async def on_member_join(self, member: discord.Member) -> None:
+        if member.guild.id in self.counts and not member.bot:
+            self.counts[member.guild.id] += 1
+
+    async def on_member_remove(self, member: discord.Member) -> None:
+        if member.guild.id in self.counts and not member.bot:
+            self.counts[member.guild.id] -= 1
+
+    async def on_guild_remove(self, guild: discord.Guild) -> None:
+        self.counts.pop(guild.id, None)
+
+
+# name -> how to compute it for a msg
+VARIABLES: Dict[str, Callable[[discord.Message, MemberCounter], Any]] = {
+    "guild_name": lambda msg, members: msg.guild.name,
+    "guild_id": lambda msg, members: msg.guild.id,
+    "user_mention": lambda msg, members: msg.author.mention,
+    "user_name": lambda msg, members: msg.author.display_name,
+    "guild_mc": lambda msg, members: members.get(msg.guild),
+    "guild_mc_ord": lambda msg, members: make_ordinal(members.get(msg.guild)),
+    "timestamp": lambda msg, members: msg.created_at,
+}
+
+
+class TemplateVariables:
+    """
+    Lazily computes the variables for a msg,
+    only the ones a template references get computed, once each.
+    """
+
+    __slots__ = ("msg", "members", "values", "cacheable")
+
+    def __init__(self, msg: discord.Message, members: MemberCounter):
+        self.msg = msg
+        self.members = members
+        self.values: Dict[str, Any] = {}
+        # Cleared once a render with these fell back to
+        # its source or used something random
+        self.cacheable = True
+
+    def resolve(self, names: Iterable[str]) -> Dict[str, Any]:
+        """
+        Parameters
+        ----------
+        names: Iterable[str]
+            The variables a template uses
+
+        Returns
+        -------
+        Dict[str, Any]
+            Every variable computed so far, including the given ones
+        """
+        for name in names:
+            if name not in self.values and name in VARIABLES:
+                self.values[name] = VARIABLES[name](self.msg, self.members)
+
+        return self.values
@@ -2,7 +2,7 @@ import os
 import datetime
 from datetime import timedelta
 import humanize
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 import discord
 from discord.ext import commands
@@ -13,19 +13,35 @@ from bot.help import MyHelp
 from bot.db import MongoManager
 from bot.db.managers import SettingsManager
 from bot.cache import TimedCache
+from bot.cache.abc import Cache
 
 
 class BaseBot(commands.Bot):
+    # Default prefixes and guilds without any prefix get invalidated
+    # by SettingsManager.set, so they can be kept around for longer
+    PREFIX_TTL = timedelta(minutes=30)
+    DEFAULT_PREFIX_TTL = timedelta(hours=6)
+    NO_PREFIX_TTL = timedelta(hours=6)
+    # How long an expired prefix is still used while it's refreshed
+    PREFIX_STALE_TTL = timedelta(minutes=30)
+
     def __init__(self, *args, **kwargs) -> None:
 
         self.__uptime = datetime.datetime.now()
 
         self.DEFAULT_PREFIX: str = kwargs.pop("command_prefix")
-        self.prefix_cache: TimedCache = TimedCache()
+        self.prefix_cache: TimedCache = TimedCache(
+            max_size=kwargs.pop("prefix_cache_size", 10_000)
+        )
         kwargs["command_prefix"] = self.get_command_prefix
 
+        self.caches: Dict[str, Cache] = {}
+        self.register_cache("prefix", self.prefix_cache)
+
         self.db: MongoManager = MongoManager(
-            kwargs.pop("mongo_url"), kwargs.pop("db_name", None)
+            kwargs.pop("mongo_url"),
+            kwargs.pop("db_name", None),
+            write_behind=kwargs.pop("db_write_behind", None),
         )
         kwargs["help_command"] = MyHelp()
 
@@ -35,12 +51,34 @@ class BaseBot(commands.Bot):
     def uptime(self) -> datetime.datetime:
         return self.__uptime
 
+    def register_cache(self, name: str, cache: Cache) -> None:
+        """
+        Registers a cache so its stats show up in the cachestats command.
+
+        Parameters
+        ----------
+        name : str
+            The name to display the cache under
+        cache : Cache
+            The cache itself
+        """
+        self.caches[name] = cache
+
     def get_uptime(self) -> str:
         return humanize.precisedelta(self.uptime - datetime.datetime.now())
 
     async def get_context(self, msg, *, cls=CustomContext) -> CustomContext:
         return await super().get_context(msg, cls=cls)
 
+    async def setup_hook(self) -> None:
+        self.prefix_cache.start_sweeper()
+
+    async def close(self) -> None:
+        self.prefix_cache.stop_sweeper()
+        # Don't lose writes still sitting in the write-behind buffers
+        await self.db.close()
+        await super().close()
+
     async def on_ready(self) -> None:
         await self.load_extension("jishaku")
 
@@ -125,16 +163,40 @@ class BaseBot(commands.Bot):
             return a valid prefix
         """
 
-        if guild_id in self.prefix_cache:
-            return self.prefix_cache.get_entry(guild_id)
+        async def load() -> Optional[str]:
+            # None is cached as well so guilds without a prefix stay O(1)
+            return await self.SettingsManager.fetch_prefix(guild_id)
 
-        prefix = await self.SettingsManager.fetch_prefix(guild_id)
+        prefix = await self.prefix_cache.get_or_load(
+            guild_id,
+            load,
+            ttl=self.get_prefix_ttl,
+            stale_ttl=self.PREFIX_STALE_TTL,
+        )
 
         if not prefix:
             raise PrefixNotFound
 
-        if prefix != self.DEFAULT_PREFIX:
-            self.prefix_cache.add_entry(
-                guild_id, prefix, ttl=timedelta(minutes=30), override=True
-            )
         return prefix
+
+    def get_prefix_ttl(self, prefix: Optional[str]) -> timedelta:
+        """
+        Returns how long a prefix should be cached for.
+
+        Parameters
+        ----------
+        prefix : Optional[str]
+            The prefix being cached, None if the guild has no prefix
+
+        Returns
+        -------
+        timedelta
+            The ttl for the prefix cache entry
+        """
+        if prefix is None:
+            return self.NO_PREFIX_TTL
+
+        if prefix == self.DEFAULT_PREFIX:
+            return self.DEFAULT_PREFIX_TTL
+
+        return self.PREFIX_TTL
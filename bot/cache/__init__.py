@@ -1,2 +1,3 @@
 from bot.cache.entry import Entry
+from bot.cache.stats import CacheStats
 from bot.cache.timed import TimedCache
\ No newline at end of file
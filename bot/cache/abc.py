@@ -1,5 +1,18 @@
 from datetime import timedelta
-from typing import runtime_checkable, Protocol, Any
+from typing import (
+    runtime_checkable,
+    Protocol,
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    Mapping,
+    Optional,
+    Union,
+)
+
+from bot.cache.stats import CacheStats
 
 
 @runtime_checkable
@@ -52,7 +65,7 @@ class Cache(Protocol):
 
     def force_clean(self) -> None:
         """
-        Iterates over the cache, removing outdated entries.
+        Removes outdated entries from the cache.
 
         Implemented since by default the cache only cleans
         on access. I.e its lazy
@@ -77,4 +90,87 @@ class Cache(Protocol):
             Either the cache doesn't contain
             the key, or the Entry timed out
         """
+        raise NotImplementedError
+
+    def get_stats(self) -> CacheStats:
+        """
+        Returns
+        -------
+        CacheStats
+            A snapshot of this caches counters,
+            i.e hits, misses, expirations, evictions,
+            current size and approximate bytes
+        """
+        raise NotImplementedError
+
+
+@runtime_checkable
+class AsyncCache(Protocol):
+    async def get_or_load(
+        self,
+        key: Any,
+        loader: Callable[[], Awaitable[Any]],
+        *,
+        ttl: Union[timedelta, Callable[[Any], Optional[timedelta]]] = None,
+        stale_ttl: timedelta = None,
+    ) -> Any:
+        """
+        Returns the value for a key, loading and
+        storing it with the loader on a miss.
+
+        Concurrent misses for the same key are coalesced,
+        so the loader only runs once for all of them.
+
+        Parameters
+        ----------
+        key: Any
+            The key to get an entry for
+        loader: Callable[[], Awaitable[Any]]
+            Called to load the value on a miss
+        ttl: Union[timedelta, Callable[[Any], Optional[timedelta]]], optional
+            How long a loaded entry should be valid for,
+            if a callable is passed it's called with the
+            loaded value to pick the ttl.
+            Defaults to forever
+        stale_ttl: timedelta, optional
+            How long after the ttl the stale value can still
+            be returned while it's refreshed in the background.
+            Defaults to not serving stale values
+
+        Returns
+        -------
+        Any
+            The cached or freshly loaded value
+        """
+        raise NotImplementedError
+
+    async def get_many(self, keys: Iterable[Any]) -> Dict[Any, Any]:
+        """
+        Parameters
+        ----------
+        keys: Iterable[Any]
+            The keys to get entries for
+
+        Returns
+        -------
+        Dict[Any, Any]
+            The values for the keys which exist
+            in the cache, missing keys are omitted
+        """
+        raise NotImplementedError
+
+    async def set_many(
+        self, entries: Mapping[Any, Any], *, ttl: timedelta = None
+    ) -> None:
+        """
+        Adds or overrides several entries at once.
+
+        Parameters
+        ----------
+        entries: Mapping[Any, Any]
+            The keys and values to store
+        ttl: timedelta, optional
+            How long these entries should be valid for.
+            Defaults to forever
+        """
         raise NotImplementedError
\ No newline at end of file
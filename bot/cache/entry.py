@@ -7,4 +7,6 @@ import attr
 @attr.s(slots=True)
 class Entry:
     value: Any = attr.ib()
-    expiry_time: Optional[datetime] = attr.ib(default=None)
\ No newline at end of file
+    expiry_time: Optional[datetime] = attr.ib(default=None)
+    size: int = attr.ib(default=0)
+    refresh_time: Optional[datetime] = attr.ib(default=None)
\ No newline at end of file
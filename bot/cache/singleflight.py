@@ -0,0 +1,52 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent loads for the same key,
+    so only one of them actually runs and everyone
+    else waits on its result.
+
+    The load runs in its own task which every caller,
+    the first one included, waits on shielded. So a cancelled
+    caller never cancels the load for the others.
+    """
+
+    __slots__ = ("_calls",)
+
+    def __init__(self):
+        self._calls: Dict[Any, asyncio.Task] = {}
+
+    def __contains__(self, key: Any) -> bool:
+        return key in self._calls
+
+    async def do(self, key: Any, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Parameters
+        ----------
+        key: Any
+            What to coalesce loads on
+        loader: Callable[[], Awaitable[Any]]
+            Called to load the value if no
+            load is in flight for this key
+
+        Returns
+        -------
+        Any
+            The result of the loader
+        """
+        task = self._calls.get(key)
+        if task is None:
+            task = self._calls[key] = asyncio.create_task(loader())
+            task.add_done_callback(lambda done: self._done(key, done))
+
+        return await asyncio.shield(task)
+
+    def _done(self, key: Any, task: asyncio.Task) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Everyone waiting may have been cancelled,
+        # don't warn about it never being retrieved
+        if not task.cancelled():
+            task.exception()
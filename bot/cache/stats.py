@@ -0,0 +1,17 @@
+import attr
+
+
+@attr.s(slots=True)
+class CacheStats:
+    hits: int = attr.ib(default=0)
+    misses: int = attr.ib(default=0)
+    expirations: int = attr.ib(default=0)
+    evictions: int = attr.ib(default=0)
+    refreshes: int = attr.ib(default=0)
+    size: int = attr.ib(default=0)
+    approx_bytes: int = attr.ib(default=0)
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
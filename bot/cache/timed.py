@@ -1,55 +1,321 @@
-from copy import deepcopy
+import asyncio
+import heapq
+import itertools
+import logging
+import sys
+from collections import OrderedDict
 from datetime import timedelta, datetime
-from typing import Any, Dict
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Mapping,
+    Optional,
+    Tuple,
+    Union,
+)
 
-from bot.cache import Entry
-from bot.cache.abc import Cache
+from bot.cache import Entry, CacheStats
+from bot.cache.abc import Cache, AsyncCache
+from bot.cache.singleflight import SingleFlight
 from bot.exceptions import NonExistentEntry, ExistingEntry
 
+log = logging.getLogger(__name__)
 
 # This class is unit-tested in my AntiSpam repo
-class TimedCache(Cache):
-    __slots__ = ("cache",)
+class TimedCache(Cache, AsyncCache):
+    """
+    A cache where entries can expire after a given time to live.
 
-    def __init__(self):
-        self.cache: Dict[Any, Entry] = {}
+    Parameters
+    ----------
+    max_size: int, optional
+        The maximum amount of entries to hold, once
+        reached the least recently used entry is evicted.
+        Defaults to unbounded
+    max_bytes: int, optional
+        An approximate memory budget for the stored
+        keys and values, enforced the same way as max_size.
+        Defaults to unbounded
+
+    Notes
+    -----
+    Sizes are measured with ``sys.getsizeof`` so they are
+    shallow, containers are only counted as the container itself.
+
+    Expiry times are indexed in a min-heap, so cleaning only
+    touches entries which have actually expired.
+
+    Entries added with a ``stale_ttl`` go stale once their ttl passes
+    but are still served for another ``stale_ttl``, during which
+    ``get_or_load`` returns the stale value and refreshes it in
+    the background. I.e stale-while-revalidate
+    """
+
+    __slots__ = (
+        "cache",
+        "max_size",
+        "max_bytes",
+        "_bytes",
+        "_expiries",
+        "_counter",
+        "_sweeper",
+        "_stats",
+        "_flights",
+        "_refreshes",
+    )
+
+    def __init__(
+        self, *, max_size: Optional[int] = None, max_bytes: Optional[int] = None
+    ):
+        self.cache: Dict[Any, Entry] = OrderedDict()
+        self.max_size: Optional[int] = max_size
+        self.max_bytes: Optional[int] = max_bytes
+        self._bytes: int = 0
+        # (expiry_time, tiebreaker, key), stale items are skipped lazily
+        self._expiries: List[Tuple[datetime, int, Any]] = []
+        self._counter = itertools.count()
+        self._sweeper: Optional[asyncio.Task] = None
+        self._stats: CacheStats = CacheStats()
+        self._flights: SingleFlight = SingleFlight()
+        self._refreshes: Dict[Any, asyncio.Task] = {}
 
     def __contains__(self, item: Any) -> bool:
         try:
             entry = self.cache[item]
             if entry.expiry_time and entry.expiry_time < datetime.now():
                 self.delete_entry(item)
+                self._stats.expirations += 1
                 return False
         except KeyError:
             return False
         else:
             return True
 
+    def __len__(self) -> int:
+        return len(self.cache)
+
+    @property
+    def bounded(self) -> bool:
+        return self.max_size is not None or self.max_bytes is not None
+
     def add_entry(
-        self, key: Any, value: Any, *, ttl: timedelta = None, override: bool = False
+        self,
+        key: Any,
+        value: Any,
+        *,
+        ttl: timedelta = None,
+        override: bool = False,
+        stale_ttl: timedelta = None,
     ) -> None:
         if key in self and not override:
             raise ExistingEntry
 
-        if ttl:
-            self.cache[key] = Entry(value=value, expiry_time=(datetime.now() + ttl))
+        self.delete_entry(key)
+
+        size = sys.getsizeof(key) + sys.getsizeof(value)
+        if ttl and stale_ttl:
+            now = datetime.now()
+            entry = Entry(
+                value=value,
+                expiry_time=(now + ttl + stale_ttl),
+                size=size,
+                refresh_time=(now + ttl),
+            )
+        elif ttl:
+            entry = Entry(value=value, expiry_time=(datetime.now() + ttl), size=size)
         else:
-            self.cache[key] = Entry(value=value)
+            entry = Entry(value=value, size=size)
+
+        self.cache[key] = entry
+        self._bytes += size
+
+        if entry.expiry_time:
+            heapq.heappush(
+                self._expiries, (entry.expiry_time, next(self._counter), key)
+            )
+            if len(self._expiries) > 2 * len(self.cache) + 64:
+                self._rebuild_expiries()
+
+        if self.bounded:
+            self._evict()
 
     def delete_entry(self, key: Any) -> None:
         try:
-            self.cache.pop(key)
+            entry = self.cache.pop(key)
         except KeyError:
             pass
+        else:
+            self._bytes -= entry.size
 
     def get_entry(self, key: Any) -> Any:
         if key not in self:
+            self._stats.misses += 1
             raise NonExistentEntry
 
+        self._stats.hits += 1
+
+        if self.bounded:
+            self.cache.move_to_end(key)
+
         return self.cache[key].value
 
+    async def get_or_load(
+        self,
+        key: Any,
+        loader: Callable[[], Awaitable[Any]],
+        *,
+        ttl: Union[timedelta, Callable[[Any], Optional[timedelta]]] = None,
+        stale_ttl: timedelta = None,
+    ) -> Any:
+        async def load() -> Any:
+            value = await loader()
+            entry_ttl = ttl(value) if callable(ttl) else ttl
+            self.add_entry(
+                key, value, ttl=entry_ttl, override=True, stale_ttl=stale_ttl
+            )
+            return value
+
+        try:
+            value = self.get_entry(key)
+        except NonExistentEntry:
+            return await self._flights.do(key, load)
+
+        refresh_time = self.cache[key].refresh_time
+        if (
+            refresh_time
+            and refresh_time < datetime.now()
+            and key not in self._refreshes
+            and key not in self._flights
+        ):
+            self._stats.refreshes += 1
+            task = asyncio.create_task(self._flights.do(key, load))
+            self._refreshes[key] = task
+            task.add_done_callback(lambda t: self._refresh_done(key, t))
+
+        return value
+
+    async def get_many(self, keys: Iterable[Any]) -> Dict[Any, Any]:
+        found = {}
+        for key in keys:
+            try:
+                found[key] = self.get_entry(key)
+            except NonExistentEntry:
+                pass
+
+        return found
+
+    async def set_many(
+        self, entries: Mapping[Any, Any], *, ttl: timedelta = None
+    ) -> None:
+        for key, value in entries.items():
+            self.add_entry(key, value, ttl=ttl, override=True)
+
+    def get_stats(self) -> CacheStats:
+        stats = self._stats
+        return CacheStats(
+            hits=stats.hits,
+            misses=stats.misses,
+            expirations=stats.expirations,
+            evictions=stats.evictions,
+            refreshes=stats.refreshes,
+            size=len(self.cache),
+            approx_bytes=self._bytes,
+        )
+
     def force_clean(self) -> None:
+        self.sweep()
+
+    def sweep(self, limit: Optional[int] = None) -> int:
+        """
+        Removes expired entries using the expiry index.
+
+        Parameters
+        ----------
+        limit: int, optional
+            The maximum amount of entries to remove,
+            defaults to every expired entry
+
+        Returns
+        -------
+        int
+            How many entries were removed
+        """
         now = datetime.now()
-        for k, v in deepcopy(self.cache).items():
-            if v.expiry_time and v.expiry_time < now:
-                self.delete_entry(k)
\ No newline at end of file
+        removed = 0
+        while self._expiries and self._expiries[0][0] < now:
+            if limit is not None and removed >= limit:
+                break
+
+            expiry_time, _, key = heapq.heappop(self._expiries)
+            entry = self.cache.get(key)
+            # The key was since deleted or re-added with another ttl
+            if entry is None or entry.expiry_time != expiry_time:
+                continue
+
+            self.delete_entry(key)
+            removed += 1
+
+        self._stats.expirations += removed
+        return removed
+
+    def start_sweeper(self, interval: float = 60, batch: int = 500) -> None:
+        """
+        Starts a background task which periodically
+        removes expired entries, at most ``batch``
+        entries before yielding back to the event loop.
+
+        Parameters
+        ----------
+        interval: float
+            Seconds between each sweep
+        batch: int
+            How many entries to remove per tick
+        """
+        if self._sweeper and not self._sweeper.done():
+            return
+
+        self._sweeper = asyncio.create_task(self._sweep_loop(interval, batch))
+
+    def stop_sweeper(self) -> None:
+        if self._sweeper:
+            self._sweeper.cancel()
+            self._sweeper = None
+
+    async def _sweep_loop(self, interval: float, batch: int) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            while self.sweep(batch) == batch:
+                await asyncio.sleep(0)
+
+    def _refresh_done(self, key: Any, task: asyncio.Task) -> None:
+        self._refreshes.pop(key, None)
+        if task.cancelled():
+            return
+
+        # The stale value is kept until it hard expires
+        exc = task.exception()
+        if exc:
+            log.warning("Background cache refresh failed", exc_info=exc)
+
+    def _rebuild_expiries(self) -> None:
+        """Drops stale items from the expiry index."""
+        self._expiries = [
+            (entry.expiry_time, next(self._counter), key)
+            for key, entry in self.cache.items()
+            if entry.expiry_time
+        ]
+        heapq.heapify(self._expiries)
+
+    def _evict(self) -> None:
+        """Drops least recently used entries until we are within our bounds."""
+        while self.cache and (
+            (self.max_size is not None and len(self.cache) > self.max_size)
+            or (self.max_bytes is not None and self._bytes > self.max_bytes)
+        ):
+            _, entry = self.cache.popitem(last=False)
+            self._bytes -= entry.size
+            self._stats.evictions += 1
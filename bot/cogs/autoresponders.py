@@ -4,7 +4,7 @@ from pprint import pprint
 import discord
 from discord.ext import commands, tasks
 
-from bot.exceptions import TriggerDoesNotExist, TriggerExists
+from bot.exceptions import TriggerDoesNotExist, TriggerExists, InvalidPattern
 from bot.paginators import SimplePaginator
 from bot.db.managers import ARManager
 
@@ -31,6 +31,11 @@ class Autoresponders(commands.Cog):
     def cog_unload(self):
         try:
             self.bot.remove_listener(self.ARManager.on_msg, "on_message")
+            members = self.ARManager.members
+            self.bot.remove_listener(members.on_member_join, "on_member_join")
+            self.bot.remove_listener(members.on_member_remove, "on_member_remove")
+            self.bot.remove_listener(members.on_guild_remove, "on_guild_remove")
+            self.ARManager.close()
         except Exception:
             pass
 
@@ -42,8 +47,16 @@ class Autoresponders(commands.Cog):
         await self.bot.wait_until_ready()
         self.ARManager = ARManager(self.bot.db, self.bot)
         await self.ARManager.initialize()
+        self.bot.register_cache("ar_templates", self.ARManager.templates.cache)
+        self.bot.register_cache("ar_responses", self.ARManager.responses.cache)
+        self.bot.register_cache("ar_cooldowns", self.ARManager.cooldowns.cache)
         self.bot.add_listener(self.ARManager.on_msg, "on_message")
 
+        members = self.ARManager.members
+        self.bot.add_listener(members.on_member_join, "on_member_join")
+        self.bot.add_listener(members.on_member_remove, "on_member_remove")
+        self.bot.add_listener(members.on_guild_remove, "on_guild_remove")
+
     @commands.command(aliases=["var"])
     async def variables(self, ctx):
         """
@@ -212,6 +225,70 @@ class Autoresponders(commands.Cog):
             # Re-raise for other handlers
             raise error
 
+    @ar.command(aliases=["case", "ic"])
+    @can_manage_msgs()
+    async def ignorecase(self, ctx, *, trigger: str):
+        """
+        Toggle whether an AR should trigger regardless of case
+        """
+        try:
+            data = await self.ARManager.fetch_guild_ars(ctx.guild.id, trigger)
+            data = await self.ARManager.edit_ar(
+                ctx.guild.id,
+                trigger=trigger,
+                **{"ignore_case?": not data.get("ignore_case?", False)},
+            )
+        except TriggerDoesNotExist:
+            await ctx.send_line("The AR does not exist.")
+            return
+
+        val = "on" if data["ignore_case?"] else "off"
+        await ctx.send_line(f"Ignoring case was turned {val} for that AR!")
+
+    @ar.command(name="match")
+    @can_manage_msgs()
+    async def match_mode(self, ctx, mode: str, *, trigger: str):
+        """
+        Change how an AR is matched: exact, startswith, contains, glob or regex
+        """
+        try:
+            await self.ARManager.edit_ar(
+                ctx.guild.id, trigger=trigger, match=mode.lower()
+            )
+        except TriggerDoesNotExist:
+            await ctx.send_line("The AR does not exist.")
+            return
+        except InvalidPattern as e:
+            await ctx.send_line(str(e))
+            return
+
+        await ctx.send_line(f"That AR now uses `{mode.lower()}` matching!")
+
+    @ar.command(aliases=["cd"])
+    @can_manage_msgs()
+    async def cooldown(self, ctx, scope: str, rate: int, per: float, *, trigger: str):
+        """
+        Limit an AR to `rate` responses every `per` seconds,
+        per trigger, user or channel. A rate of 0 removes the cooldown
+        """
+        try:
+            await self.ARManager.set_cooldown(
+                ctx.guild.id, trigger, scope.lower(), rate, per
+            )
+        except TriggerDoesNotExist:
+            await ctx.send_line("The AR does not exist.")
+            return
+        except ValueError as e:
+            await ctx.send_line(str(e))
+            return
+
+        if rate:
+            await ctx.send_line(
+                f"That AR can now respond {rate} time(s) every {per:g}s per {scope.lower()}!"
+            )
+        else:
+            await ctx.send_line(f"Removed the per {scope.lower()} cooldown of that AR!")
+
     @ar.command(aliases=["-"])
     @can_manage_msgs()
     async def remove(self, ctx, *, trigger: Union[str, int]):
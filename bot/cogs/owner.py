@@ -0,0 +1,106 @@
+import discord
+from discord.ext import commands
+
+from bot.cache.abc import Cache
+
+
+class Owner(commands.Cog, command_attrs=dict(hidden=True)):
+    """Owner only cmds, for the rest there's jishaku"""
+
+    def __init__(self, bot):
+        self.bot = bot
+
+    async def cog_check(self, ctx):
+        return await self.bot.is_owner(ctx.author)
+
+    @commands.command(aliases=["cstats"])
+    async def cachestats(self, ctx, name: str = None):
+        """
+        Show hit/miss/eviction counters for the bot's caches
+        """
+        caches = self.bot.caches
+        if name:
+            if name not in caches:
+                await ctx.send_line(f"There is no cache called `{name}`.")
+                return
+            caches = {name: caches[name]}
+
+        embed = discord.Embed(title="Cache stats", color=0x2F3136)
+        for cache_name, cache in caches.items():
+            cache: Cache
+            stats = cache.get_stats()
+            embed.add_field(
+                name=cache_name,
+                value=(
+                    f"**hits** : {stats.hits}\n"
+                    f"**misses** : {stats.misses}\n"
+                    f"**hit rate** : {stats.hit_rate:.1%}\n"
+                    f"**expirations** : {stats.expirations}\n"
+                    f"**evictions** : {stats.evictions}\n"
+                    f"**refreshes** : {stats.refreshes}\n"
+                    f"**size** : {stats.size}\n"
+                    f"**approx. bytes** : {stats.approx_bytes}"
+                ),
+            )
+
+        await ctx.send(embed=embed)
+
+    @commands.command(aliases=["arq"])
+    async def arqueue(self, ctx, guild_id: int = None):
+        """
+        Show the state of the outbound AR send queue
+        """
+        cog = self.bot.get_cog("Autoresponders")
+        if cog is None or not hasattr(cog, "ARManager"):
+            await ctx.send_line("The autoresponders aren't loaded yet.")
+            return
+
+        outbox = cog.ARManager.outbox
+        stats = outbox.get_stats()
+        embed = discord.Embed(title="AR send queue", color=0x2F3136)
+        embed.description = (
+            f"**queued** : {stats.depth}\n"
+            f"**channels** : {stats.channels}\n"
+            f"**sent** : {stats.sent}\n"
+            f"**collapsed** : {stats.collapsed}\n"
+            f"**dropped** : {stats.dropped}\n"
+            f"**failed** : {stats.failed}"
+        )
+        if guild_id:
+            embed.add_field(name=str(guild_id), value=f"**queued** : {outbox.depth(guild_id)}")
+
+        await ctx.send(embed=embed)
+
+    @commands.command(aliases=["dbs"])
+    async def dbstats(self, ctx):
+        """
+        Show the write-behind buffer stats of each db collection
+        """
+        stats = self.bot.db.get_write_stats()
+        if self.bot.db.write_behind is None or not stats:
+            await ctx.send_line("Write-behind is off, every write goes straight to the db.")
+            return
+
+        embed = discord.Embed(
+            title=f"Write-behind ({self.bot.db.write_behind:g}s)", color=0x2F3136
+        )
+        for name, doc_stats in stats.items():
+            embed.add_field(
+                name=name,
+                value=(
+                    f"**pending** : {doc_stats.pending}\n"
+                    f"**queued** : {doc_stats.queued}\n"
+                    f"**coalesced** : {doc_stats.coalesced}\n"
+                    f"**writes** : {doc_stats.writes}\n"
+                    f"**flushes** : {doc_stats.flushes}\n"
+                    f"**failed** : {doc_stats.failed}\n"
+                    f"**last flush** : {doc_stats.last_flush_ms:.1f}ms\n"
+                    f"**max flush** : {doc_stats.max_flush_ms:.1f}ms"
+                ),
+            )
+
+        await ctx.send(embed=embed)
+
+
+async def setup(bot):
+    await bot.add_cog(Owner(bot))
@@ -3,6 +3,8 @@ from pprint import pprint
 import discord
 from discord.ext import commands, tasks
 
+from bot.exceptions import InvalidMode, ReactionDoesNotExists
+from bot.paginators import SimplePaginator
 from bot.db.managers import ReactionRolesManager
 
 
@@ -23,6 +25,16 @@ class ReactionRoles(commands.Cog):
 
         return commands.check(predicate)
 
+    def cog_unload(self):
+        try:
+            manager = self.ReactionRolesManager
+            self.bot.remove_listener(manager.reaction_add, "on_raw_reaction_add")
+            self.bot.remove_listener(manager.reaction_remove, "on_raw_reaction_remove")
+            self.bot.remove_listener(manager.on_ready, "on_ready")
+            manager.close()
+        except Exception:
+            pass
+
     @tasks.loop(count=1)
     async def cache_roles(self) -> None:
         """
@@ -31,12 +43,19 @@ class ReactionRoles(commands.Cog):
         await self.bot.wait_until_ready()
         self.ReactionRolesManager = ReactionRolesManager(self.bot.db, self.bot)
         await self.ReactionRolesManager.initialize()
+        self.bot.register_cache("rr_members", self.ReactionRolesManager.members)
+        self.bot.register_cache("rr_dm_closed", self.ReactionRolesManager.dms.closed)
         self.bot.add_listener(
             self.ReactionRolesManager.reaction_add, "on_raw_reaction_add"
         )
         self.bot.add_listener(
             self.ReactionRolesManager.reaction_remove, "on_raw_reaction_remove"
         )
+        # Ready fires again after every fresh IDENTIFY, which is when events are
+        # lost. Resumes replay what was missed so they don't need a pass
+        self.bot.add_listener(self.ReactionRolesManager.on_ready, "on_ready")
+        # The first ready has already fired by now, so catch up in the background
+        await self.ReactionRolesManager.on_ready()
 
     @commands.group(name="rroles", aliases=["rr"], invoke_without_command=True)
     @can_manage_roles()
@@ -167,6 +186,39 @@ class ReactionRoles(commands.Cog):
                 await ctx.send_line("Gotcha")
                 break
 
+    @reaction_roles.command(name="list", aliases=["ls"])
+    @can_manage_roles()
+    async def list_msgs(self, ctx):
+        """
+        List the reaction role msgs in this server
+        """
+        msgs = await self.ReactionRolesManager.fetch_guild_msgs(ctx.guild.id)
+        if not msgs:
+            await ctx.send_line("This server has no reaction roles.")
+            return
+
+        # Split by length, a msg can have 20 reactions so a page
+        # of a fixed number of msgs could go over the description limit
+        paginator = commands.Paginator(prefix="", suffix="", max_size=4000)
+        for data in msgs:
+            link = (
+                f"https://discord.com/channels/{ctx.guild.id}/"
+                f"{data.get('channel_id')}/{data['_id']}"
+            )
+            state = "on" if data["is_enabled"] else "off"
+            roles = " ".join(
+                f"{d['emoji']} <@&{d['role_id']}>" for d in data["roles"]
+            )
+            paginator.add_line(f"[`{data['_id']}`]({link}) ({state}) : {roles}")
+
+        embeds = [
+            discord.Embed(
+                title=f"{ctx.guild.name}'s reaction roles", description=page
+            )
+            for page in paginator.pages
+        ]
+        await SimplePaginator(pages=embeds).send(ctx)
+
     @reaction_roles.command()
     @can_manage_roles()
     async def clear(self, ctx, msg_id: int):
@@ -182,6 +234,26 @@ class ReactionRoles(commands.Cog):
         message = await channel.fetch_message(msg_id)
         await message.clear_reactions()
 
+    @reaction_roles.command()
+    @can_manage_roles()
+    async def mode(self, ctx, msg_id: int, mode: str, limit: int = 1):
+        """
+        Set how a msg's roles work: normal, unique (one role),
+        limit (at most `limit` roles) or verify (roles are never removed)
+        """
+        try:
+            await self.ReactionRolesManager.set_mode(
+                guild_id=ctx.guild.id, msg_id=msg_id, mode=mode.lower(), limit=limit
+            )
+        except ReactionDoesNotExists:
+            await ctx.send_line("That msg has no reaction roles.")
+            return
+        except InvalidMode as e:
+            await ctx.send_line(str(e))
+            return
+
+        await ctx.send_line(f"That msg's reaction roles now use the `{mode.lower()}` mode!")
+
     @reaction_roles.group(invoke_without_command=True)
     async def toggle(self, ctx):
         """
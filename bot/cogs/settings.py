@@ -1,6 +1,5 @@
 import discord
 from discord.ext import commands, tasks
-from datetime import timedelta
 
 from bot.db.managers import SettingsManager
 
@@ -29,7 +28,7 @@ class Settings(commands.Cog):
         Caching settings,what else is there to say?
         """
         await self.bot.wait_until_ready()
-        self.bot.SettingsManager = SettingsManager(self.bot.db)
+        self.bot.SettingsManager = SettingsManager(self.bot.db, self.bot)
         await self.bot.SettingsManager.initialize()
 
     @commands.group(aliases=["config", "settings"], invoke_without_command=True)
@@ -37,7 +36,10 @@ class Settings(commands.Cog):
         """
         Display the current settings for your guild
         """
-        prefix = await self.bot.SettingsManager.fetch_prefix(ctx.guild.id)
+        prefix = (
+            await self.bot.SettingsManager.fetch_prefix(ctx.guild.id)
+            or self.bot.DEFAULT_PREFIX
+        )
         embed = discord.Embed(
             description=f"Use `{prefix}set`  to change settings!\n **__prefix__** : {prefix}"
         )
@@ -56,14 +58,18 @@ class Settings(commands.Cog):
             await ctx.send_line("The given prefix is too long,try something smaller")
             return
 
-        OGprefix = await self.bot.SettingsManager.fetch_prefix(ctx.guild.id)
+        OGprefix = (
+            await self.bot.SettingsManager.fetch_prefix(ctx.guild.id)
+            or self.bot.DEFAULT_PREFIX
+        )
 
         await self.bot.SettingsManager.set(ctx.guild.id, "prefix", prefix)
 
-        self.bot.prefix_cache.delete_entry(ctx.guild.id)
-
         self.bot.prefix_cache.add_entry(
-            ctx.guild.id, prefix, ttl=timedelta(hours=1), override=True
+            ctx.guild.id,
+            prefix,
+            ttl=self.bot.get_prefix_ttl(prefix),
+            override=True,
         )
 
         await ctx.send_line(
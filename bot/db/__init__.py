@@ -1,2 +1,2 @@
-from bot.db.documents import Document
+from bot.db.documents import Document, WriteBehindStats
 from bot.db.mongo import MongoManager
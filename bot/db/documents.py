@@ -1,12 +1,32 @@
+import asyncio
 import functools
-from copy import deepcopy
+import logging
+import time
 from typing import List, Dict, Optional, Union, Any, TypeVar, Type
 
+import attr
 from motor.motor_asyncio import AsyncIOMotorDatabase, AsyncIOMotorCollection
-from pymongo.results import DeleteResult
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from pymongo.results import DeleteResult, UpdateResult
 
 T = TypeVar("T")
 
+log = logging.getLogger(__name__)
+
+
+@attr.s(slots=True)
+class WriteBehindStats:
+    # Upserts buffered, and how many of them were folded into another
+    queued: int = attr.ib(default=0)
+    coalesced: int = attr.ib(default=0)
+    flushes: int = attr.ib(default=0)
+    writes: int = attr.ib(default=0)
+    failed: int = attr.ib(default=0)
+    pending: int = attr.ib(default=0)
+    last_flush_ms: float = attr.ib(default=0.0)
+    max_flush_ms: float = attr.ib(default=0.0)
+
 
 def return_converted(func):
     """
@@ -38,12 +58,15 @@ def return_converted(func):
 
 class Document:
     _version = 9.1
+    # Bumped by every array operation, to guard against concurrent edits
+    VERSION_FIELD = "_v"
 
     def __init__(
         self,
         database: AsyncIOMotorDatabase,
         document_name: str,
         converter: Optional[Type[T]] = None,
+        write_behind: Optional[float] = None,
     ):
         """
         Parameters
@@ -56,6 +79,17 @@ class Document:
             An optional converter to try
             convert all data-types which
             return either Dict or List into
+        write_behind: Optional[float]
+            If given, upserts by _id are buffered and
+            written in bulk every this many seconds.
+            Defaults to writing straight away
+
+        Notes
+        -----
+        In write-behind mode upserts of the same _id within an interval
+        are merged into one $set. Reads and any other write flush the
+        buffer first, deletes by _id just drop what's buffered for it,
+        so the database never looks out of order from here.
         """
         self._document_name: str = document_name
         self._database: AsyncIOMotorDatabase = database
@@ -63,6 +97,12 @@ class Document:
 
         self.converter: Type[T] = converter
 
+        self.write_behind: Optional[float] = write_behind
+        self._pending: Dict[Any, Dict[str, Any]] = {}
+        self._flush_lock = asyncio.Lock()
+        self._flusher: Optional[asyncio.Task] = None
+        self._write_stats = WriteBehindStats()
+
     def __repr__(self):
         return f"<Document(document_name={self.document_name})>"
 
@@ -132,7 +172,8 @@ class Document:
         if data is None:
             # Backwards compat so you can just pass something like
             # await doc.upsert({"_id": 1, "data": False})
-            data = deepcopy(filter_dict)
+            # Shallow, we only pop the _id off of it
+            data = dict(filter_dict)
             filter_dict = self.__convert_filter(data.pop("_id"))
 
         await self.update_by_custom(filter_dict, data, *args, **kwargs)
@@ -157,6 +198,7 @@ class Document:
             The items matching the filter
         """
         filter_dict = filter_dict or {}
+        await self.flush()
 
         return await self._document.find(filter_dict, *args, **kwargs).to_list(None)
 
@@ -187,6 +229,7 @@ class Document:
 
         """
         existence = not where_field_doesnt_exist
+        await self.flush()
         return await self._document.find({field: {"$exists": existence}}).to_list(None)
 
     @return_converted
@@ -226,6 +269,7 @@ class Document:
             The result of the query
         """
         self.__ensure_dict(filter_dict)
+        await self.flush()
 
         return await self._document.find_one(filter_dict)
 
@@ -248,6 +292,7 @@ class Document:
             The result of the query
         """
         self.__ensure_dict(filter_dict)
+        await self.flush()
 
         return await self._document.find(filter_dict).to_list(None)
 
@@ -288,6 +333,12 @@ class Document:
         """
         self.__ensure_dict(filter_dict)
 
+        if filter_dict.keys() == {"_id"}:
+            # Whatever is buffered for it would be deleted anyway,
+            # the flush still waits out one already in flight
+            self._pending.pop(filter_dict["_id"], None)
+        await self.flush()
+
         result: DeleteResult = await self._document.delete_many(filter_dict)
         result: Optional[DeleteResult] = result if result.deleted_count != 0 else None
         return result
@@ -302,6 +353,7 @@ class Document:
             The data to insert
         """
         self.__ensure_dict(data)
+        await self.flush()
 
         await self._document.insert_one(data)
 
@@ -338,9 +390,21 @@ class Document:
         if data is None:
             # Backwards compat so you can just pass something like
             # await doc.upsert({"_id": 1, "data": False})
-            data = deepcopy(filter_dict)
+            # Shallow, we only pop the _id off of it
+            data = dict(filter_dict)
             filter_dict = self.__convert_filter(data.pop("_id"))
 
+        if (
+            self.write_behind is not None
+            and option == "set"
+            and not args
+            and not kwargs
+            and filter_dict.keys() == {"_id"}
+        ):
+            self.__ensure_dict(data)
+            self._buffer(filter_dict["_id"], data)
+            return
+
         await self.upsert_custom(filter_dict, data, option, *args, **kwargs)
 
     async def update_by_id(
@@ -367,6 +431,7 @@ class Document:
         self.__ensure_id(data)
 
         data_id = data.pop("_id")
+        await self.flush()
         await self._document.update_one(
             {"_id": data_id}, {f"${option}": data}, *args, **kwargs
         )
@@ -422,6 +487,7 @@ class Document:
         """
         self.__ensure_dict(filter_dict)
         self.__ensure_dict(update_data)
+        await self.flush()
 
         # Update
         await self._document.update_one(
@@ -457,6 +523,7 @@ class Document:
             The field to remove
         """
         self.__ensure_dict(filter_dict)
+        await self.flush()
         await self._document.update_one(filter_dict, {"$unset": {field: True}})
 
     async def increment(
@@ -494,6 +561,7 @@ class Document:
             The key for the field to increment
         """
         self.__ensure_dict(filter_dict)
+        await self.flush()
         await self._document.update_one(filter_dict, {"$inc": {field: amount}})
 
     async def update_field_to(
@@ -513,8 +581,147 @@ class Document:
         """
         filter_dict = self.__convert_filter(filter_dict)
         self.__ensure_dict(filter_dict)
+        await self.flush()
         await self._document.update_one(filter_dict, {"$set": {field: new_value}})
 
+    async def push(
+        self,
+        filter_dict: Union[Dict, Any],
+        field: str,
+        value: Any,
+        *,
+        condition: Optional[Dict[str, Any]] = None,
+        upsert: bool = False,
+        set_fields: Optional[Dict[str, Any]] = None,
+        set_on_insert: Optional[Dict[str, Any]] = None,
+        version: Optional[int] = None,
+    ) -> bool:
+        """
+        Append an item to an array field, sending only the item.
+
+        Parameters
+        ----------
+        filter_dict: Union[Dict, Any]
+            The _id of the item to update,
+            if a Dict is passed that is
+            used as the filter.
+        field: str
+            The array to push to
+        value: Any
+            The item to push
+        condition: Optional[Dict[str, Any]]
+            Extra filters the document has to match, i.e
+            ``{"roles.emoji": {"$ne": emoji}}`` to keep items unique
+        upsert: bool
+            Whether to create the document if nothing matches
+        set_fields: Optional[Dict[str, Any]]
+            Other fields to $set in the same operation
+        set_on_insert: Optional[Dict[str, Any]]
+            Fields to set only if the document gets created
+        version: Optional[int]
+            Only update if the document is at this version
+
+        Returns
+        -------
+        bool
+            Whether a document was updated or created
+
+        Raises
+        ------
+        DuplicateKeyError
+            upsert was given and the document exists
+            but didn't match the condition/version
+        """
+        update: Dict[str, Any] = {"$push": {field: value}}
+        if set_fields:
+            update["$set"] = set_fields
+        if set_on_insert:
+            update["$setOnInsert"] = set_on_insert
+
+        return await self._array_update(
+            filter_dict, update, condition, version, upsert=upsert
+        )
+
+    async def pull(
+        self,
+        filter_dict: Union[Dict, Any],
+        field: str,
+        match: Any,
+        *,
+        condition: Optional[Dict[str, Any]] = None,
+        version: Optional[int] = None,
+    ) -> bool:
+        """
+        Remove every item matching ``match`` from an array field.
+
+        Parameters
+        ----------
+        filter_dict: Union[Dict, Any]
+            The _id of the item to update,
+            if a Dict is passed that is
+            used as the filter.
+        field: str
+            The array to pull from
+        match: Any
+            The value or query of the items to remove, i.e ``{"role_id": 1}``
+        condition: Optional[Dict[str, Any]]
+            Extra filters the document has to match
+        version: Optional[int]
+            Only update if the document is at this version
+
+        Returns
+        -------
+        bool
+            Whether something was removed
+        """
+        # Only match documents which have something to pull
+        condition = {
+            **(condition or {}),
+            field: {"$elemMatch": match} if isinstance(match, dict) else match,
+        }
+        return await self._array_update(
+            filter_dict, {"$pull": {field: match}}, condition, version
+        )
+
+    async def set_array_element(
+        self,
+        filter_dict: Union[Dict, Any],
+        field: str,
+        match: Dict[str, Any],
+        changes: Dict[str, Any],
+        *,
+        condition: Optional[Dict[str, Any]] = None,
+        version: Optional[int] = None,
+    ) -> bool:
+        """
+        Set fields on the first item of an array field matching ``match``.
+
+        Parameters
+        ----------
+        filter_dict: Union[Dict, Any]
+            The _id of the item to update,
+            if a Dict is passed that is
+            used as the filter.
+        field: str
+            The array the item is in
+        match: Dict[str, Any]
+            A query for the item, i.e ``{"trigger": "hi"}``
+        changes: Dict[str, Any]
+            The fields of the item to set
+        condition: Optional[Dict[str, Any]]
+            Extra filters the document has to match
+        version: Optional[int]
+            Only update if the document is at this version
+
+        Returns
+        -------
+        bool
+            Whether an item matched
+        """
+        condition = {**(condition or {}), field: {"$elemMatch": match}}
+        update = {"$set": {f"{field}.$.{key}": value for key, value in changes.items()}}
+        return await self._array_update(filter_dict, update, condition, version)
+
     async def bulk_insert(self, data: List[Dict]) -> None:
         """
         Given a List of Dictionaries, bulk insert all of
@@ -526,8 +733,132 @@ class Document:
             The data to bulk insert
         """
         self.__ensure_list_of_dicts(data)
+        await self.flush()
         await self._document.insert_many(data)
 
+    async def _array_update(
+        self,
+        filter_dict: Union[Dict, Any],
+        update: Dict[str, Any],
+        condition: Optional[Dict[str, Any]],
+        version: Optional[int],
+        upsert: bool = False,
+    ) -> bool:
+        filter_dict = {**self.__convert_filter(filter_dict), **(condition or {})}
+        if version is not None:
+            # Documents from before versioning count as version 0
+            filter_dict[self.VERSION_FIELD] = (
+                {"$in": [0, None]} if version == 0 else version
+            )
+        update = {**update, "$inc": {self.VERSION_FIELD: 1}}
+        # Setting the version too would conflict with bumping it
+        for operator in ("$set", "$setOnInsert"):
+            fields = update.get(operator)
+            if fields and self.VERSION_FIELD in fields:
+                update[operator] = {
+                    k: v for k, v in fields.items() if k != self.VERSION_FIELD
+                }
+
+        await self.flush()
+        result: UpdateResult = await self._document.update_one(
+            filter_dict, update, upsert=upsert
+        )
+        return bool(result.matched_count or result.upserted_id is not None)
+
+    # <-- Write-behind -->
+    async def flush(self) -> None:
+        """
+        Writes every buffered upsert with one unordered bulk write.
+        A no-op when nothing is buffered.
+        """
+        if not self._pending and not self._flush_lock.locked():
+            return
+
+        async with self._flush_lock:
+            if not self._pending:
+                return
+
+            pending, self._pending = self._pending, {}
+            ids = list(pending)
+            ops = [
+                UpdateOne({"_id": _id}, {"$set": pending[_id]}, upsert=True)
+                for _id in ids
+            ]
+
+            started = time.perf_counter()
+            try:
+                await self._document.bulk_write(ops, ordered=False)
+            except BulkWriteError as e:
+                failed = [ids[error["index"]] for error in e.details["writeErrors"]]
+                self._requeue(pending, failed)
+                log.warning(
+                    "%s of %s buffered writes to %s failed",
+                    len(failed),
+                    len(ops),
+                    self.document_name,
+                )
+            except asyncio.CancelledError:
+                # Not known to have been written, upserts are safe to redo
+                self._requeue(pending, ids)
+                raise
+            except Exception:
+                self._requeue(pending, ids)
+                log.warning(
+                    "Flushing buffered writes to %s failed",
+                    self.document_name,
+                    exc_info=True,
+                )
+            else:
+                self._write_stats.writes += len(ops)
+            finally:
+                elapsed = (time.perf_counter() - started) * 1000
+                stats = self._write_stats
+                stats.flushes += 1
+                stats.last_flush_ms = elapsed
+                stats.max_flush_ms = max(stats.max_flush_ms, elapsed)
+
+    async def close(self) -> None:
+        """
+        Stops the periodic flushing and writes anything still buffered,
+        waiting on a flush already in flight rather than cutting it short.
+        """
+        if self._flusher:
+            self._flusher.cancel()
+            self._flusher = None
+        await self.flush()
+
+    def get_write_stats(self) -> WriteBehindStats:
+        stats = attr.evolve(self._write_stats)
+        stats.pending = len(self._pending)
+        return stats
+
+    def _buffer(self, _id: Any, data: Dict[str, Any]) -> None:
+        pending = self._pending.get(_id)
+        if pending is None:
+            self._pending[_id] = dict(data)
+        else:
+            pending.update(data)
+            self._write_stats.coalesced += 1
+        self._write_stats.queued += 1
+
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_later())
+
+    def _requeue(self, pending: Dict[Any, Dict[str, Any]], ids: List[Any]) -> None:
+        """Puts failed writes back, under anything buffered since."""
+        self._write_stats.failed += len(ids)
+        for _id in ids:
+            self._pending[_id] = {**pending[_id], **self._pending.get(_id, {})}
+
+    async def _flush_later(self) -> None:
+        while True:
+            await asyncio.sleep(self.write_behind)
+            # Shielded so close() cancelling this mid write
+            # leaves the write running, close() then waits on it
+            await asyncio.shield(self.flush())
+            if not self._pending:
+                break
+
     # <-- Private methods -->
     @staticmethod
     def __ensure_list_of_dicts(data: List[Dict]):
@@ -1,19 +1,44 @@
-from copy import deepcopy
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
 from functools import wraps
 from typing import Optional, Union, List, Tuple
 
 import discord
 from discord.ext import commands
-import jinja2.sandbox
+import jinja2
+from pymongo.errors import DuplicateKeyError
 
 from bot.exceptions import TriggerExists, TriggerDoesNotExist
 from bot.db import MongoManager
+from bot.cache.singleflight import SingleFlight
+from bot.ar import (
+    TriggerIndex,
+    PatternMatcher,
+    TemplateCache,
+    CompiledTemplate,
+    ResponseCache,
+    SendQueue,
+    CooldownTracker,
+    COOLDOWN_SCOPES,
+    MAX_COOLDOWN_RATE,
+    MAX_COOLDOWN_PER,
+    MemberCounter,
+    TemplateVariables,
+    make_ordinal,
+    is_template,
+    normalize_trigger,
+    validate_pattern,
+)
+from bot.ar.sandbox import GuardedEnvironment
+
+log = logging.getLogger(__name__)
 
 # sample = {
 #     "_id" : "guildID",
 #     "enabled" : True or False,
 #     "autoresponders" : [
-#         {"trigger" : "hi", "response" : "yes?", "is_embed?" : True,"created_by" : 12234}
+#         {"trigger" : "hi", "response" : "yes?", "is_embed?" : True,"created_by" : 12234, "ignore_case?" : False, "match" : "exact", "cooldowns" : {"user" : [1, 5.0]}}
 #     ]
 # }
 
@@ -29,13 +54,29 @@ class ARManager:
         The database to be used.
     bot : BaseBot
         The bot instance used to handle events.
+    offload_renders : bool
+        Whether templates with loops/macros are rendered
+        in a worker thread rather than on the event loop.
 
     """
 
-    def __init__(self, db: MongoManager, bot) -> None:
+    def __init__(self, db: MongoManager, bot, offload_renders: bool = True) -> None:
         self.db = db
         self.bot = bot
         self.cached = False
+        self._loads = SingleFlight()
+        self.index = TriggerIndex()
+        self.patterns = PatternMatcher()
+        self.env = GuardedEnvironment()
+        self.offload_renders = offload_renders
+        self._render_executor = ThreadPoolExecutor(
+            max_workers=2, thread_name_prefix="ar-render"
+        )
+        self.templates = TemplateCache(self.env)
+        self.members = MemberCounter()
+        self.responses = ResponseCache()
+        self.outbox = SendQueue()
+        self.cooldowns = CooldownTracker()
 
     def database_check(fn):
         @wraps(fn)
@@ -59,6 +100,8 @@ class ARManager:
 
         for guild in guilds:
             self.ARs[guild["_id"]] = guild
+            self.index.build(guild["_id"], guild["autoresponders"])
+            self.patterns.build(guild["_id"], guild["autoresponders"])
 
     async def fetch_guild_ars(
         self, guild_id: int, trigger: Optional[Union[str, int]] = None
@@ -77,12 +120,19 @@ class ARManager:
         -------
         data : dict
             The data from the db.
+
+        Notes
+        -----
+        The data is shared with the cache and must not be mutated,
+        mutations build a new document and swap it in instead.
         """
 
         if not self.cached:
-            data = await self.db.autoresponders.find({"_id": guild_id})
+            data = await self._loads.do(
+                guild_id, lambda: self.db.autoresponders.find({"_id": guild_id})
+            )
         else:
-            data = deepcopy(self.ARs[guild_id]) if guild_id in self.ARs else None
+            data = self.ARs.get(guild_id)
 
         if not data:
             data = {"_id": guild_id, "is_enabled?": True, "autoresponders": []}
@@ -90,6 +140,30 @@ class ARManager:
         if not trigger:
             return data
 
+        return self.get_trigger(data, trigger)
+
+    @staticmethod
+    def get_trigger(data: dict, trigger: Union[str, int]) -> dict:
+        """
+        Find a trigger within a guilds AR data.
+
+        Parameters
+        ----------
+        data : dict
+            The guild data, as returned by fetch_guild_ars
+        trigger : str/int
+            The trigger word or the position of the AR
+
+        Returns
+        -------
+        dict
+            The AR for said trigger
+
+        Raises
+        ------
+        TriggerDoesNotExist
+            The trigger does not exist.
+        """
         try:
             if trigger.isdigit():
                 trigger_data = data["autoresponders"][int(trigger) - 1]
@@ -110,6 +184,8 @@ class ARManager:
         user_id: int = None,
         trigger: str = None,
         response: Union[str, dict] = None,
+        ignore_case: bool = False,
+        match: str = "exact",
     ) -> dict:
         """
         Add autoresponders to a guild.
@@ -124,12 +200,21 @@ class ARManager:
             The trigger word for the AR
         response : Union[str, dict]
             The response for the AR
+        ignore_case : bool
+            Whether the trigger should match regardless
+            of case and unicode form (NFKC + casefold)
+        match : str
+            How the trigger is matched, one of
+            exact, startswith, contains, glob or regex
 
         Raises
         ------
         TriggerExists
             The trigger already exists.
+        InvalidPattern
+            The trigger isn't valid for the match mode.
         """
+        validate_pattern(match, trigger, ignore_case)
 
         data = {
             "trigger": trigger,
@@ -137,22 +222,47 @@ class ARManager:
             "created_by": user_id,
             "is_embed?": False,
             "reply?": False,
+            "ignore_case?": ignore_case,
+            "match": match,
         }
 
         guild_data = await self.fetch_guild_ars(guild_id)
 
-        if any(d["trigger"] == data["trigger"] for d in guild_data["autoresponders"]):
+        if self.cached:
+            exists = (
+                self.index.get(guild_id, trigger) is not None
+                or self.patterns.get(guild_id, trigger) is not None
+            )
+        else:
+            exists = any(d["trigger"] == trigger for d in guild_data["autoresponders"])
+
+        if exists:
             raise TriggerExists
 
         if isinstance(response, dict):
             data["is_embed?"] = True
 
-        guild_data["autoresponders"].append(data)
+        try:
+            await self.db.autoresponders.push(
+                guild_id,
+                "autoresponders",
+                data,
+                condition={"autoresponders.trigger": {"$ne": trigger}},
+                upsert=True,
+                set_on_insert={"is_enabled?": guild_data["is_enabled?"]},
+            )
+        except DuplicateKeyError:
+            # The guild exists and another edit already added the trigger
+            raise TriggerExists
+
+        guild_data = {
+            **guild_data,
+            "autoresponders": [*guild_data["autoresponders"], data],
+        }
 
         if self.cached:
             self.ARs[guild_id] = guild_data
-
-        await self.db.autoresponders.upsert(guild_data)
+            self._index_ar(guild_id, data)
 
     @database_check
     async def remove_ar(
@@ -175,21 +285,152 @@ class ARManager:
 
         guild_data = await self.fetch_guild_ars(guild_id)
 
-        trigger_data = await self.fetch_guild_ars(guild_id, trigger)
+        trigger_data = self.get_trigger(guild_data, trigger)
+
+        guild_data = {
+            **guild_data,
+            "autoresponders": [
+                ar for ar in guild_data["autoresponders"] if ar is not trigger_data
+            ],
+        }
 
-        i = guild_data["autoresponders"].index(trigger_data)
+        if self.cached:
+            self._unindex_ar(guild_id, trigger_data)
+
+        self._invalidate_ar(guild_id, trigger_data["trigger"])
 
-        guild_data["autoresponders"].pop(i)
+        await self.db.autoresponders.pull(
+            guild_id, "autoresponders", {"trigger": trigger_data["trigger"]}
+        )
 
         if len(guild_data["autoresponders"]) == 0:
             if self.cached:
-                self.ARs.pop(guild_id)
-            await self.db.autoresponders.delete(guild_id)
+                self.ARs.pop(guild_id, None)
+            # Unless another AR was added in the meantime
+            await self.db.autoresponders.delete(
+                {"_id": guild_id, "autoresponders": {"$size": 0}}
+            )
+            return
+
+        if self.cached:
+            self.ARs[guild_id] = guild_data
+
+    @database_check
+    async def edit_ar(
+        self, guild_id: int = None, trigger: Union[str, int] = None, **changes
+    ) -> dict:
+        """
+        Edit the fields of an AR in a guild.
+
+        Parameters
+        ----------
+        guild_id : int
+            The ID of the guild.
+        trigger : str/int
+            The trigger word for the AR
+        **changes
+            The fields to change, i.e ``{"ignore_case?": True}``
+
+        Returns
+        -------
+        dict
+            The edited AR
+
+        Raises
+        ------
+        TriggerDoesNotExist
+            The trigger does not exist.
+        InvalidPattern
+            The trigger isn't valid for the new match mode.
+        """
+
+        guild_data = await self.fetch_guild_ars(guild_id)
+
+        trigger_data = self.get_trigger(guild_data, trigger)
+        new_data = {**trigger_data, **changes}
+
+        if "match" in changes or "ignore_case?" in changes:
+            validate_pattern(
+                new_data.get("match", "exact"),
+                new_data["trigger"],
+                bool(new_data.get("ignore_case?")),
+            )
+
+        guild_data = {
+            **guild_data,
+            "autoresponders": [
+                new_data if ar is trigger_data else ar
+                for ar in guild_data["autoresponders"]
+            ],
+        }
 
         if self.cached:
             self.ARs[guild_id] = guild_data
+            self._unindex_ar(guild_id, trigger_data)
+            self._index_ar(guild_id, new_data)
+
+        self._invalidate_ar(guild_id, trigger_data["trigger"])
+
+        await self.db.autoresponders.set_array_element(
+            guild_id, "autoresponders", {"trigger": trigger_data["trigger"]}, changes
+        )
+        return new_data
+
+    async def set_cooldown(
+        self,
+        guild_id: int,
+        trigger: Union[str, int],
+        scope: str,
+        rate: int,
+        per: float,
+    ) -> dict:
+        """
+        Set or remove one of the cooldowns of an AR.
+
+        Parameters
+        ----------
+        guild_id : int
+            The ID of the guild.
+        trigger : str/int
+            The trigger word for the AR
+        scope : str
+            One of COOLDOWN_SCOPES, what the cooldown is per
+        rate : int
+            How many times the AR can fire per window, 0 removes the cooldown
+        per : float
+            The length of the window in seconds
+
+        Returns
+        -------
+        dict
+            The edited AR
 
-        await self.db.autoresponders.upsert(guild_data)
+        Raises
+        ------
+        TriggerDoesNotExist
+            The trigger does not exist.
+        ValueError
+            The scope is unknown or the rate/window is negative or too large.
+        """
+        if scope not in COOLDOWN_SCOPES:
+            raise ValueError(f"Cooldowns can only be per {', '.join(COOLDOWN_SCOPES)}.")
+        if rate < 0 or per <= 0:
+            raise ValueError("The rate and window can't be negative.")
+        if rate > MAX_COOLDOWN_RATE:
+            raise ValueError(f"The rate can be at most {MAX_COOLDOWN_RATE}.")
+        if not per <= MAX_COOLDOWN_PER:
+            raise ValueError(
+                f"The window can be at most {MAX_COOLDOWN_PER // 3600} hours."
+            )
+
+        trigger_data = await self.fetch_guild_ars(guild_id, trigger)
+        cooldowns = {
+            k: v for k, v in trigger_data.get("cooldowns", {}).items() if k != scope
+        }
+        if rate:
+            cooldowns[scope] = [rate, per]
+
+        return await self.edit_ar(guild_id, trigger=trigger, cooldowns=cooldowns)
 
     @database_check
     async def format_guild_ars(self, guild_id: int) -> List[str]:
@@ -264,72 +505,233 @@ class ARManager:
         """
         Event to handle AR stuff.
         """
-        ar_data = await self.fetch_guild_ars(msg.guild.id)
-
-        if len(ar_data["autoresponders"]) == 0:
+        if not msg.guild:
             return
 
+        if self.cached:
+            data = self.index.lookup(msg.guild.id, msg.content)
+            if not data and msg.guild.id in self.patterns:
+                data = await self.patterns.match(msg.guild.id, msg.content)
+            if not data:
+                return
+
+            ar_data = await self.fetch_guild_ars(msg.guild.id)
+        else:
+            ar_data = await self.fetch_guild_ars(msg.guild.id)
+            data = self.match_trigger(ar_data, msg.content)
+            if not data:
+                return
+
         if not ar_data["is_enabled?"]:
             return
 
-        if not any(d["trigger"] == msg.content for d in ar_data["autoresponders"]):
+        if not self.cooldowns.hit(msg.guild.id, data, msg):
             return
 
-        data = await self.fetch_guild_ars(msg.guild.id, trigger=msg.content)
+        response = self.responses.get(msg.guild, data["trigger"], self.members)
+        if response is None:
+            variables = TemplateVariables(msg, self.members)
+            content, embed = await self.render_response(
+                msg.guild.id, data, variables
+            )
+            response = self.responses.put(
+                msg.guild, data["trigger"], variables, content=content, embed=embed
+            )
+
+        self.outbox.put(
+            msg.guild.id,
+            msg.channel,
+            data["trigger"],
+            content=response.content,
+            embed=response.embed,
+        )
+
+    async def render_response(
+        self, guild_id: int, data: dict, variables: TemplateVariables
+    ) -> Tuple[Optional[str], Optional[discord.Embed]]:
+        """
+        Render the response of an AR.
 
-        variables = {
-            "guild_name": msg.guild.name,
-            "guild_id": msg.guild.id,
-            "user_mention": msg.author.mention,
-            "user_name": msg.author.display_name,
-            "guild_mc": sum(not member.bot for member in msg.guild.members),
-            "guild_mc_ord": self.make_ordinal(
-                sum(not member.bot for member in msg.guild.members)
-            ),
-            "timestamp": msg.created_at,
-        }
+        Parameters
+        ----------
+        guild_id : int
+            The ID of the guild.
+        data : dict
+            The AR
+        variables : TemplateVariables
+            The variables for the msg
 
-        env = jinja2.sandbox.SandboxedEnvironment()
+        Returns
+        -------
+        Tuple[Optional[str], Optional[discord.Embed]]
+            The text and embed to send
+        """
 
         if data["is_embed?"]:
-            embed = discord.Embed.from_dict(data["response"])
-            try:
-                embed.title = env.from_string(embed.title).render(**variables)
-            except (jinja2.TemplateError, TypeError):
-                pass  # Keep original if templating fails
-            try:
-                embed.description = env.from_string(embed.description).render(**variables)
-            except (jinja2.TemplateError, TypeError):
-                pass
-            try:
-                if embed.footer:
-                    embed.set_footer(text=env.from_string(embed.footer.text).render(**variables))
-            except (jinja2.TemplateError, TypeError):
-                pass
-            try:
-                if embed.author:
-                    embed.set_author(name=env.from_string(embed.author.name).render(**variables))
-            except (jinja2.TemplateError, TypeError):
-                pass
-
-            for field in embed.fields:
-                try:
-                    field["name"] = env.from_string(field["name"]).render(**variables)
-                except (jinja2.TemplateError, TypeError):
-                    pass
-                try:
-                    field["value"] = env.from_string(field["value"]).render(**variables)
-                except (jinja2.TemplateError, TypeError):
-                    pass
-
-            await msg.channel.send(embed=embed)
-            return
+            plan = self.templates.embed_plan(
+                guild_id, data["trigger"], data["response"]
+            )
+            values = [
+                (path, await self.render_compiled(guild_id, compiled, source, variables))
+                for path, source, compiled in plan.slots
+            ]
+            return None, discord.Embed.from_dict(plan.fill(values))
+
+        content = await self.render_template(
+            guild_id, data["trigger"], "response", data["response"], variables
+        )
+        return content, None
+
+    async def render_template(
+        self,
+        guild_id: int,
+        trigger: str,
+        field: str,
+        source: Optional[str],
+        variables: TemplateVariables,
+    ) -> Optional[str]:
+        """
+        Render part of an AR response with its cached compiled template.
+
+        Parameters
+        ----------
+        guild_id : int
+            The ID of the guild.
+        trigger : str
+            The trigger word for the AR
+        field : str
+            Which part of the response this is
+        source : Optional[str]
+            The template source
+        variables : TemplateVariables
+            The variables for the msg, only those
+            the template references are computed
+
+        Returns
+        -------
+        Optional[str]
+            The rendered text, the source itself if rendering
+            fails or goes over the render limits
+        """
+        if not is_template(source):
+            return source
+
+        compiled = self.templates.get(guild_id, trigger, field, source)
+        if compiled is None:
+            return source
+
+        return await self.render_compiled(guild_id, compiled, source, variables)
+
+    async def render_compiled(
+        self,
+        guild_id: int,
+        compiled: CompiledTemplate,
+        source: str,
+        variables: TemplateVariables,
+    ) -> str:
+        """
+        Render a compiled template within the render limits.
+
+        Parameters
+        ----------
+        guild_id : int
+            The ID of the guild.
+        compiled : CompiledTemplate
+            The template to render
+        source : str
+            The template source, returned if rendering fails
+        variables : TemplateVariables
+            The variables for the msg
+
+        Returns
+        -------
+        str
+            The rendered text, the source itself if rendering
+            fails or goes over the render limits
+        """
+        values = variables.resolve(compiled.variables)
+        if not compiled.deterministic:
+            variables.cacheable = False
 
         try:
-            msg_data = env.from_string(data["response"]).render(**variables)
-        except (jinja2.TemplateError, TypeError):
-            msg_data = data["response"]  # Fallback to original
-        await msg.channel.send(msg_data)
+            if compiled.expensive and self.offload_renders:
+                loop = asyncio.get_running_loop()
+                return await asyncio.wait_for(
+                    loop.run_in_executor(
+                        self._render_executor,
+                        self.env.render,
+                        compiled.template,
+                        dict(values),
+                    ),
+                    # The render stops itself once over budget, this is a backstop
+                    self.env.time_budget * 4,
+                )
+
+            return self.env.render(compiled.template, values)
+        except asyncio.TimeoutError:
+            log.warning("Rendering an AR in guild %s timed out", guild_id)
+        except (jinja2.TemplateError, TypeError, ValueError, OverflowError):
+            pass
+
+        # Fallback to original, a render can run out of time just
+        # because the bot was busy so this mustn't get cached
+        variables.cacheable = False
+        return source
+
+    def close(self) -> None:
+        """
+        Shuts down the worker threads used for regex matching and rendering,
+        and cancels any pending sends.
+        """
+        self.outbox.close()
+        self.patterns.close()
+        self._render_executor.shutdown(wait=False)
+
+    def _invalidate_ar(self, guild_id: int, trigger: str) -> None:
+        self.templates.invalidate(guild_id, trigger)
+        self.responses.invalidate(guild_id, trigger)
+
+    def _index_ar(self, guild_id: int, ar: dict) -> None:
+        self.index.add(guild_id, ar)
+        self.patterns.add(guild_id, ar)
+
+    def _unindex_ar(self, guild_id: int, ar: dict) -> None:
+        self.index.remove(guild_id, ar)
+        self.patterns.remove(guild_id, ar)
+
+    @staticmethod
+    def match_trigger(data: dict, content: str) -> Optional[dict]:
+        """
+        Linear fallback for matching a msg when the ARs aren't cached/indexed.
+        Only exact triggers are matched here.
+
+        Parameters
+        ----------
+        data : dict
+            The guild data, as returned by fetch_guild_ars
+        content : str
+            The content of the msg
+
+        Returns
+        -------
+        Optional[dict]
+            The AR triggered by the msg
+        """
+        for ar in data["autoresponders"]:
+            if ar["trigger"] == content and ar.get("match", "exact") == "exact":
+                return ar
+
+        folded = normalize_trigger(content)
+        return next(
+            (
+                ar
+                for ar in data["autoresponders"]
+                if ar.get("ignore_case?")
+                and ar.get("match", "exact") == "exact"
+                and normalize_trigger(ar["trigger"]) == folded
+            ),
+            None,
+        )
 
     def make_ordinal(self, n):
         """
@@ -340,9 +742,4 @@ class ARManager:
             make_ordinal(122) => '122nd'
             make_ordinal(213) => '213th'
         """
-        n = int(n)
-        if 11 <= (n % 100) <= 13:
-            suffix = "th"
-        else:
-            suffix = ["th", "st", "nd", "rd", "th"][min(n % 10, 4)]
-        return str(n) + suffix
+        return make_ordinal(n)
@@ -1,9 +1,26 @@
-from copy import deepcopy
+import asyncio
+from datetime import timedelta
 from functools import wraps
-from typing import Union, List
+from typing import Optional, Union, List
 
-from bot.exceptions import ReactionExists, ReactionDoesNotExists
+import discord
+
+from pymongo.errors import DuplicateKeyError
+
+from bot.exceptions import ReactionExists, ReactionDoesNotExists, InvalidMode
 from bot.db import MongoManager
+from bot.cache import TimedCache
+from bot.cache.singleflight import SingleFlight
+from bot.rr import (
+    RRIndex,
+    RoleMutator,
+    Reconciler,
+    ReactionCleanup,
+    DMOutbox,
+    RR_MODES,
+    emoji_key,
+    emoji_roles,
+)
 
 # sample = {
 #     "_id" : "msgID"
@@ -13,6 +30,8 @@ from bot.db import MongoManager
 #     {"emoji": str(emoji), "role_id": int(role_id)},
 #         ]
 #     "is_enabled?" : True
+#     "mode" : "normal" or "unique" or "limit" or "verify"
+#     "limit" : 2
 
 # }
 
@@ -30,10 +49,30 @@ class ReactionRolesManager:
 
     """
 
+    # How long a member fetched over REST is trusted for
+    MEMBER_TTL = timedelta(minutes=2)
+
     def __init__(self, db: MongoManager, bot) -> None:
         self.db = db
         self.bot = bot
         self.cached = False
+        self._loads = SingleFlight()
+        # Members which weren't in the gateway cache, keyed by (guild_id, user_id)
+        self.members = TimedCache(max_size=1000)
+        self.index = RRIndex()
+        self.mutations = RoleMutator()
+        self.reconciler = Reconciler(self)
+        self.cleanup = ReactionCleanup(bot)
+        self.dms = DMOutbox()
+
+    def close(self) -> None:
+        """
+        Stops reconciling and cancels any role changes which haven't been applied yet.
+        """
+        self.reconciler.stop()
+        self.mutations.close()
+        self.cleanup.close()
+        self.dms.close()
 
     def database_check(fn):
         @wraps(fn)
@@ -60,6 +99,17 @@ class ReactionRolesManager:
         for msg in msgs:
             self.reaction_roles[msg["_id"]] = msg
 
+        self.index.build(msgs)
+
+    async def on_ready(self) -> None:
+        """
+        Event for "on_ready", catches up on reactions which
+        happened while the bot was away. A pass already running
+        is left to finish rather than started again.
+        """
+        if self.cached:
+            self.reconciler.start()
+
     async def fetch_msg_roles(
         self,
         guild_id: int,
@@ -88,32 +138,38 @@ class ReactionRolesManager:
                 ]
             }
 
+        Notes
+        -----
+        The data is shared with the cache and must not be mutated,
+        mutations build a new document and swap it in instead.
         """
 
         if not self.cached:
-            data = await self.db.reaction_roles.find({"_id": msg_id})
-        else:
-            data = (
-                deepcopy(self.reaction_roles[msg_id])
-                if msg_id in self.reaction_roles
-                else None
+            data = await self._loads.do(
+                msg_id, lambda: self.db.reaction_roles.find({"_id": msg_id})
             )
+        else:
+            data = self.reaction_roles.get(msg_id)
 
         if not data:
-            data = {
-                "_id": msg_id,
-                "guild_id": guild_id,
-                "roles": [],
-                "is_enabled": True,
-                "dm_info": {
-                    "toggle": False,
-                    "on_remove": "{role} was removed!",
-                    "on_add": "{role} was added!",
-                },
-            }
+            data = self._default_msg(guild_id, msg_id)
 
         return data
 
+    @staticmethod
+    def _default_msg(guild_id: int, msg_id: int) -> dict:
+        return {
+            "_id": msg_id,
+            "guild_id": guild_id,
+            "roles": [],
+            "is_enabled": True,
+            "dm_info": {
+                "toggle": False,
+                "on_remove": "{role} was removed!",
+                "on_add": "{role} was added!",
+            },
+        }
+
     async def add_reaction(
         self,
         guild_id: int = None,
@@ -149,13 +205,39 @@ class ReactionRolesManager:
         if any(d == data for d in msg_data["roles"]):
             raise ReactionExists
 
-        msg_data["roles"].append(data)
-        msg_data["channel_id"] = ch_id
+        # An emoji can only be bound to one role per msg
+        if emoji_key(emoji) in emoji_roles(msg_data):
+            raise ReactionExists
+
+        try:
+            await self.db.reaction_roles.push(
+                msg_id,
+                "roles",
+                data,
+                condition={"roles.emoji": {"$ne": data["emoji"]}},
+                upsert=True,
+                set_fields={"channel_id": ch_id},
+                # Only from the defaults, a loaded doc carries fields
+                # like the version which the update itself changes
+                set_on_insert={
+                    k: v
+                    for k, v in self._default_msg(guild_id, msg_id).items()
+                    if k not in ("_id", "roles")
+                },
+            )
+        except DuplicateKeyError:
+            # The msg exists and another edit already bound the emoji
+            raise ReactionExists
+
+        msg_data = {
+            **msg_data,
+            "roles": [*msg_data["roles"], data],
+            "channel_id": ch_id,
+        }
 
         if self.cached:
             self.reaction_roles[msg_id] = msg_data
-
-        await self.db.reaction_roles.upsert(msg_data)
+            self.index.add(msg_data)
 
     @database_check
     async def remove_reaction(
@@ -196,22 +278,27 @@ class ReactionRolesManager:
 
         remove = next(d for d in roles_list if d["role_id"] == role_id)
 
-        i = msg_data["roles"].index(remove)
+        msg_data = {
+            **msg_data,
+            "roles": [d for d in roles_list if d is not remove],
+        }
 
-        msg_data["roles"].pop(i)
+        await self.db.reaction_roles.pull(msg_id, "roles", {"role_id": role_id})
 
         if len(msg_data["roles"]) == 0:
 
             if self.cached:
                 self.reaction_roles.pop(msg_id)
+                self.index.remove(msg_data)
 
-            await self.db.reaction_roles.delete(msg_data)
+            # Unless another role was bound in the meantime
+            await self.db.reaction_roles.delete({"_id": msg_id, "roles": {"$size": 0}})
             return msg_data["channel_id"], remove["emoji"]
 
         if self.cached:
             self.reaction_roles[msg_id] = msg_data
+            self.index.add(msg_data)
 
-        await self.db.reaction_roles.upsert(msg_data)
         return msg_data["channel_id"], remove["emoji"]
 
     @database_check
@@ -241,8 +328,9 @@ class ReactionRolesManager:
 
         if self.cached:
             self.reaction_roles.pop(msg_id)
+            self.index.remove(msg_data)
 
-        await self.db.reaction_roles.delete(msg_data)
+        await self.db.reaction_roles.delete(msg_id)
         return msg_data["channel_id"]
 
     @database_check
@@ -271,15 +359,57 @@ class ReactionRolesManager:
         if not value:
             value = True if msg_data["is_enabled"] == False else False
 
-        msg_data["is_enabled"] = value
+        msg_data = {**msg_data, "is_enabled": value}
 
         if self.cached:
             self.reaction_roles[msg_id] = msg_data
 
-        await self.db.reaction_roles.upsert(msg_data)
+        await self.db.reaction_roles.upsert({"_id": msg_id, "is_enabled": value})
 
         return value
 
+    @database_check
+    async def set_mode(
+        self,
+        guild_id: int = None,
+        msg_id: int = None,
+        mode: str = None,
+        limit: int = 1,
+    ) -> None:
+        """
+        Set how the reaction roles of a msg behave.
+
+        Parameters
+        ----------
+        guild_id : int
+            ID of the guild.
+        msg_id : int
+            ID of the msg.
+        mode : str
+            One of RR_MODES.
+        limit : int
+            How many roles a member can have, for the limit mode.
+
+        Raises
+        ------
+        ReactionDoesNotExist
+            The given msg ID does not have reactions on it.
+        InvalidMode
+            The mode is unknown or the limit is below 1.
+        """
+        if mode not in RR_MODES:
+            raise InvalidMode(f"The mode has to be one of {', '.join(RR_MODES)}.")
+        if limit < 1:
+            raise InvalidMode("The limit has to be at least 1.")
+
+        msg_data = await self.fetch_msg_roles(guild_id, msg_id)
+        msg_data = {**msg_data, "mode": mode, "limit": limit}
+
+        if self.cached:
+            self.reaction_roles[msg_id] = msg_data
+
+        await self.db.reaction_roles.upsert({"_id": msg_id, "mode": mode, "limit": limit})
+
     @database_check
     async def toggle_dm(
         self, guild_id: int = None, msg_id: int = None, value: bool = None
@@ -308,12 +438,14 @@ class ReactionRolesManager:
         if not value:
             value = True if dm_data["toggle"] == False else False
 
-        dm_data["toggle"] = value
+        msg_data = {**msg_data, "dm_info": {**dm_data, "toggle": value}}
 
         if self.cached:
             self.reaction_roles[msg_id] = msg_data
 
-        await self.db.reaction_roles.upsert(msg_data)
+        await self.db.reaction_roles.upsert(
+            {"_id": msg_id, "dm_info": msg_data["dm_info"]}
+        )
         return value
 
     @database_check
@@ -342,81 +474,259 @@ class ReactionRolesManager:
         ReactionDoesNotExist
             The given msg ID does not have reactions on it.
         """
-        msg_data = self.fetch_msg_roles(guild_id, msg_id)
-        data = msg_data["dm_info"]
+        msg_data = await self.fetch_msg_roles(guild_id, msg_id)
+        data = dict(msg_data["dm_info"])
 
         if on_add:
             data["on_add"] = msg
         if on_remove:
             data["on_remove"] = msg
 
+        msg_data = {**msg_data, "dm_info": data}
+
         if self.cached:
             self.reaction_roles[msg_id] = msg_data
 
-        await self.db.reaction_roles.upsert(msg_data)
+        await self.db.reaction_roles.upsert({"_id": msg_id, "dm_info": data})
 
-    async def reaction_add(self, payload):
+    async def fetch_guild_msgs(self, guild_id: int) -> List[dict]:
         """
-        Event for "on_raw_reaction_add"
+        Fetch every reaction role msg in a guild.
 
+        Parameters
+        ----------
+        guild_id : int
+            ID of the guild.
+
+        Returns
+        -------
+        List[dict]
+            The reaction role msgs, shared with the cache so read only.
         """
-        if payload.user_id == self.bot.user.id:
-            return
+        if not self.cached:
+            return await self.db.reaction_roles.find_many_by_custom(
+                {"guild_id": guild_id}
+            )
 
-        data = await self.fetch_msg_roles(payload.guild_id, payload.message_id)
+        return [
+            self.reaction_roles[msg_id]
+            for msg_id in sorted(self.index.guild_msgs(guild_id))
+        ]
 
-        if len(data["roles"]) == 0:
-            return
+    def get_role_id(self, data: dict, emoji) -> Optional[int]:
+        """
+        Get the role bound to an emoji on a reaction role msg.
 
-        if not data["is_enabled"]:
-            return
+        Parameters
+        ----------
+        data : dict
+            The reaction role msg.
+        emoji : Union[str, discord.PartialEmoji]
+            The emoji that was reacted with.
 
-        guild = await self.bot.fetch_guild(payload.guild_id)
+        Returns
+        -------
+        Optional[int]
+            The ID of the role, None if the emoji isn't bound to one.
+        """
+        if self.cached and data["_id"] in self.index:
+            return self.index.get_role(data["_id"], emoji)
 
-        emote_data = next(d for d in data["roles"] if d["emoji"] in str(payload.emoji))
+        return emoji_roles(data).get(emoji_key(emoji))
 
-        role = guild.get_role(emote_data["role_id"])
+    def queue_change(
+        self,
+        data: dict,
+        payload,
+        member: discord.Member,
+        role_id: int,
+        add: bool,
+    ) -> Optional[asyncio.Future]:
+        """
+        Works out what a reaction does under the mode of its msg, as a diff
+        against the member's roles, and queues it on the RoleMutator.
 
-        user = await guild.fetch_member(payload.user_id)
+        Parameters
+        ----------
+        data : dict
+            The reaction role msg.
+        payload : discord.RawReactionActionEvent
+            The reaction event.
+        member : discord.Member
+            Who reacted.
+        role_id : int
+            The role bound to the emoji.
+        add : bool
+            Whether the reaction was added or removed.
+
+        Returns
+        -------
+        Optional[asyncio.Future]
+            The queued change, None if the reaction changes nothing.
+        """
+        mode = data.get("mode", "normal")
+        channel_id, msg_id = payload.channel_id, payload.message_id
+
+        if not add:
+            if mode == "verify":
+                return None
+            return self.mutations.queue(member, remove=[role_id])
 
-        if role not in user.roles:
-            await user.add_roles(role, reason="Reaction roles")
+        # The user re-added a reaction we were about to clean up
+        self.cleanup.discard(channel_id, msg_id, payload.emoji, member.id)
 
-            if not data["dm_info"]["toggle"]:
-                return
+        msg_roles = {d["role_id"] for d in data["roles"]}
+        held = self.mutations.projected(member) & msg_roles
 
-            send = data["dm_info"]["on_add"]
-            await user.send(f"*__{guild.name}__* : {send.format(role=role)}")
+        if mode == "limit" and role_id not in held and len(held) >= data.get("limit", 1):
+            self.cleanup.remove(channel_id, msg_id, payload.emoji, member.id)
+            return None
+
+        remove = set()
+        if mode == "unique":
+            remove = held - {role_id}
+            for d in data["roles"]:
+                if d["role_id"] in remove:
+                    self.cleanup.remove(channel_id, msg_id, d["emoji"], member.id)
+
+        return self.mutations.queue(member, add=[role_id], remove=remove)
+
+    async def resolve_guild(self, guild_id: int) -> Optional[discord.Guild]:
+        """
+        Get a guild from the gateway cache, fetching it only on a miss.
+        """
+        guild = self.bot.get_guild(guild_id)
+        if guild is not None:
+            return guild
+
+        try:
+            return await self.bot.fetch_guild(guild_id)
+        except discord.HTTPException:
+            return None
+
+    async def resolve_member(
+        self,
+        guild: discord.Guild,
+        user_id: int,
+        member: Optional[discord.Member] = None,
+    ) -> Optional[discord.Member]:
+        """
+        Get a member from the event payload or the gateway cache,
+        falling back to fetching it and caching the result.
+
+        Parameters
+        ----------
+        guild : discord.Guild
+            The guild the member is in.
+        user_id : int
+            ID of the member.
+        member : discord.Member
+            The member from the event payload, if any.
+
+        Returns
+        -------
+        Optional[discord.Member]
+            The member, None if they aren't in the guild anymore.
+        """
+        if member is not None:
+            return member
+
+        member = guild.get_member(user_id)
+        if member is not None:
+            return member
+
+        async def fetch() -> Optional[discord.Member]:
+            try:
+                return await guild.fetch_member(user_id)
+            except discord.NotFound:
+                return None
+
+        try:
+            return await self.members.get_or_load(
+                (guild.id, user_id), fetch, ttl=self.MEMBER_TTL
+            )
+        except discord.HTTPException:
+            return None
+
+    async def reaction_add(self, payload):
+        """
+        Event for "on_raw_reaction_add"
+
+        """
+        await self.handle_reaction(payload, add=True)
 
     async def reaction_remove(self, payload):
         """
         Event for "on_raw_reaction_remove"
 
+        """
+        await self.handle_reaction(payload, add=False)
+
+    async def handle_reaction(self, payload, add: bool) -> None:
+        """
+        Queues the role change for a reaction, the changes of a
+        member are batched and applied together by the RoleMutator.
+
+        Parameters
+        ----------
+        payload : discord.RawReactionActionEvent
+            The reaction event.
+        add : bool
+            Whether the reaction was added or removed.
         """
         if payload.user_id == self.bot.user.id:
             return
 
         data = await self.fetch_msg_roles(payload.guild_id, payload.message_id)
 
-        if len(data["roles"]) == 0:
+        if not data["roles"] or not data["is_enabled"]:
             return
 
-        if not data["is_enabled"]:
+        guild = await self.resolve_guild(payload.guild_id)
+        if guild is None:
             return
 
-        guild = await self.bot.fetch_guild(payload.guild_id)
+        role = self._reaction_role(guild, data, payload.emoji)
+        if role is None:
+            return
+        role_id = role.id
 
-        emote_data = next(d for d in data["roles"] if d["emoji"] in str(payload.emoji))
+        user = await self.resolve_member(
+            guild, payload.user_id, payload.member if add else None
+        )
+        if user is None:
+            return
+
+        change = self.queue_change(data, payload, user, role_id, add)
+        if change is None:
+            return
 
-        role = guild.get_role(emote_data["role_id"])
+        try:
+            added, removed = await change
+        except discord.HTTPException:
+            return
 
-        user = await guild.fetch_member(payload.user_id)
+        # A fetched member isn't kept up to date by the gateway
+        self.members.delete_entry((guild.id, user.id))
 
-        if role in user.roles:
-            await user.remove_roles(role, reason="Reaction roles")
+        if role_id in (added if add else removed):
+            self._notify(data, user, role, add)
 
-            if not data["dm_info"]["toggle"]:
-                return
+    def _reaction_role(
+        self, guild: discord.Guild, data: dict, emoji: discord.PartialEmoji
+    ) -> Optional[discord.Role]:
+        """The role bound to an emoji on a msg, if it still exists."""
+        role_id = self.get_role_id(data, emoji)
+        return None if role_id is None else guild.get_role(role_id)
+
+    def _notify(
+        self, data: dict, member: discord.Member, role: discord.Role, add: bool
+    ) -> None:
+        """DMs a member about a role they got/lost, if the msg has DMs on."""
+        if not data["dm_info"]["toggle"]:
+            return
 
-            send = data["dm_info"]["on_remove"]
-            await user.send(f"*__{guild.name}__* : {send.format(role=role)}")
+        send = data["dm_info"]["on_add" if add else "on_remove"]
+        self.dms.put(
+            member, f"*__{member.guild.name}__* : {send.format(role=role)}"
+        )
@@ -1,8 +1,8 @@
 from typing import Optional, Union
-from copy import deepcopy
 
 from bot.exceptions import InvalidSetting
 from bot.db import MongoManager
+from bot.cache.singleflight import SingleFlight
 
 sample = {
     "_id": "guildID",
@@ -18,11 +18,15 @@ class SettingsManager:
     ----------
     db : MongoManager
         The database to be used
+    bot : BaseBot, optional
+        The bot instance, used to invalidate its prefix cache
     """
 
-    def __init__(self, db: MongoManager) -> None:
+    def __init__(self, db: MongoManager, bot=None) -> None:
         self.db = db
+        self.bot = bot
         self.cached = False
+        self._loads = SingleFlight()
         self.types = ("prefix",)
 
     async def initialize(self) -> None:
@@ -54,14 +58,19 @@ class SettingsManager:
                 "_id": "guildID",
                 "prefix": "?",
                 }
+
+        Notes
+        -----
+        The data is shared with the cache and must not be mutated,
+        mutations build a new document and swap it in instead.
         """
 
         if not self.cached:
-            data = await self.db.settings.find({"_id": guild_id})
-        else:
-            data = (
-                deepcopy(self.settings[guild_id]) if guild_id in self.settings else None
+            data = await self._loads.do(
+                guild_id, lambda: self.db.settings.find({"_id": guild_id})
             )
+        else:
+            data = self.settings.get(guild_id)
 
         if not data:
             data = {
@@ -97,14 +106,17 @@ class SettingsManager:
             raise InvalidSetting
 
         data = await self.fetch_settings(guild_id)
-        data[_type] = value
+        data = {**data, _type: value}
 
         if self.cached:
             self.settings[guild_id] = data
 
         await self.db.settings.upsert(data)
 
-    async def fetch_prefix(self, guild_id: int) -> str:
+        if self.bot:
+            self.bot.prefix_cache.delete_entry(guild_id)
+
+    async def fetch_prefix(self, guild_id: int) -> Optional[str]:
         """
         Fetch the prefix of a guild!
 
@@ -115,9 +127,17 @@ class SettingsManager:
 
         Returns
         -------
-        prefix : str
-            Prefix of the aforementioned guild
+        prefix : Optional[str]
+            Prefix of the aforementioned guild,
+            None if it has no settings and so uses the bot's default
 
         """
-        data = await self.fetch_settings(guild_id)
-        return data["prefix"]
+        # Skip the copy made by fetch_settings, a str is immutable anyway
+        if self.cached:
+            data = self.settings.get(guild_id)
+        else:
+            data = await self._loads.do(
+                guild_id, lambda: self.db.settings.find({"_id": guild_id})
+            )
+
+        return data.get("prefix") if data else None
@@ -1,5 +1,4 @@
 from bot.db import MongoManager
-from copy import deepcopy
 from pprint import pprint
 from bot.exceptions import TaskExists, TaskDoesNotExist
 from discord.ext.commands import Paginator
@@ -23,12 +22,12 @@ class ToDoListManager:
         task = f"{task}\n||*(added <t:{timestamp.timestamp():.0f}:R>)*||"
         if self.cached:
             if user_id in self.to_do_list:
-                tempdict = deepcopy(self.to_do_list[user_id])
+                tempdict = self.to_do_list[user_id]
 
                 if task in tempdict["tasks"]:
                     raise TaskExists
 
-                tempdict["tasks"].append(task)
+                tempdict = {**tempdict, "tasks": [*tempdict["tasks"], task]}
 
             else:
                 tempdict = {"_id": user_id, "tasks": [task]}
@@ -47,19 +46,22 @@ class ToDoListManager:
             if user_id not in self.to_do_list:
                 raise TaskDoesNotExist
 
-            tempdict = deepcopy(self.to_do_list[user_id])
+            tempdict = self.to_do_list[user_id]
+            tasks = list(tempdict["tasks"])
 
             try:
-                tempdict["tasks"].pop(task)
+                tasks.pop(task)
             except IndexError:
                 raise TaskDoesNotExist
 
+            tempdict = {**tempdict, "tasks": tasks}
+
             self.to_do_list[user_id] = tempdict
             await self.db.todolist.upsert(tempdict)
         else:
             taskdict = await self.db.todolist.find({"_id": user_id})
             try:
-                tempdict["tasks"].pop(task)
+                taskdict["tasks"].pop(task)
             except IndexError:
                 raise TaskDoesNotExist
             await self.db.todolist.upsert(taskdict)
@@ -71,8 +73,7 @@ class ToDoListManager:
             if not self.to_do_list[user_id]["tasks"]:
                 raise TaskDoesNotExist
 
-            tempdict = deepcopy(self.to_do_list[user_id])
-            tempdict["tasks"] = []
+            tempdict = {**self.to_do_list[user_id], "tasks": []}
 
             self.to_do_list[user_id] = tempdict
             await self.db.todolist.upsert(tempdict)
@@ -1,17 +1,21 @@
 import datetime
 import logging
-from typing import List, Dict
+from typing import List, Dict, Optional
 import asyncio
 from motor.motor_asyncio import AsyncIOMotorClient
 
-from bot.db.documents import Document
+from bot.db.documents import Document, WriteBehindStats
 
 log = logging.getLogger(__name__)
 
 
 class MongoManager:
-    def __init__(self, connection_url, database_name=None):
+    def __init__(
+        self, connection_url, database_name=None, write_behind: Optional[float] = None
+    ):
         self.database_name = database_name or "production"
+        # Flush interval given to every Document, None writes straight away
+        self.write_behind = write_behind
 
         self.__mongo = AsyncIOMotorClient(connection_url)
         self.db = self.__mongo[self.database_name]
@@ -32,7 +36,7 @@ class MongoManager:
         Document
             A Document made for said item
         """
-        doc: Document = Document(self.db, item)
+        doc: Document = Document(self.db, item, write_behind=self.write_behind)
         setattr(self, item, doc)
 
         return doc
@@ -46,6 +50,24 @@ class MongoManager:
 
         return documents
 
+    async def flush(self) -> None:
+        """
+        Writes the buffered upserts of every document.
+        """
+        await asyncio.gather(*(doc.flush() for doc in self.get_current_documents()))
+
+    async def close(self) -> None:
+        """
+        Stops the write-behind flushing, writing anything still buffered.
+        """
+        await asyncio.gather(*(doc.close() for doc in self.get_current_documents()))
+
+    def get_write_stats(self) -> Dict[str, WriteBehindStats]:
+        return {
+            doc.document_name: doc.get_write_stats()
+            for doc in self.get_current_documents()
+        }
+
     async def run_backup(self):
         """
         Backs up the database within the same cluster.
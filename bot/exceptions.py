@@ -25,6 +25,10 @@ class ReactionDoesNotExists(DiscordException):
     """Reaction role exists"""
 
 
+class InvalidMode(DiscordException):
+    """Unknown reaction role mode"""
+
+
 class TaskDoesNotExist(DiscordException):
     """Task does not exist"""
 
@@ -45,6 +49,10 @@ class TriggerDoesNotExist(DiscordException):
     """Trigger does not exist"""
 
 
+class InvalidPattern(DiscordException):
+    """The trigger is not a valid pattern for its match mode"""
+
+
 class EmbedDoesNotExist(DiscordException):
     """THe embed does not exitst"""
 
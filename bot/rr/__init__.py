@@ -0,0 +1,5 @@
+from bot.rr.index import RRIndex, emoji_key, emoji_roles
+from bot.rr.mutations import RoleMutator, MutationResult, RR_MODES
+from bot.rr.reconcile import Reconciler, reconcile_roles
+from bot.rr.cleanup import ReactionCleanup
+from bot.rr.outbox import DMOutbox
@@ -0,0 +1,129 @@
+import asyncio
+import logging
+from typing import Dict, Optional, Tuple, Union
+
+import discord
+from aiolimiter import AsyncLimiter
+
+from bot.rr.index import emoji_key
+
+log = logging.getLogger(__name__)
+
+# (channel_id, msg_id, emoji key, user_id)
+Removal = Tuple[int, int, str, int]
+
+
+class ReactionCleanup:
+    """
+    A queue of user reactions to remove, i.e the other reactions
+    of a unique reaction role msg or one over a msg's limit.
+
+    Removals are deduped while queued and drained in batches
+    by a single worker under a token bucket, so a reaction storm
+    turns into a steady trickle of REST calls.
+
+    Parameters
+    ----------
+    bot: BaseBot
+        Used to get the channels
+    rate: Tuple[float, float]
+        Removals allowed, as (amount, seconds)
+    batch: int
+        How many removals to take per batch
+    """
+
+    __slots__ = ("bot", "batch", "_limiter", "_queue", "_worker", "stats")
+
+    def __init__(self, bot, rate: Tuple[float, float] = (4, 1), batch: int = 50):
+        self.bot = bot
+        self.batch = batch
+        self._limiter = AsyncLimiter(*rate)
+        # Insertion ordered, to the emoji to remove
+        self._queue: Dict[Removal, str] = {}
+        self._worker: Optional[asyncio.Task] = None
+        self.stats: Dict[str, int] = {"queued": 0, "removed": 0, "failed": 0}
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    def remove(
+        self,
+        channel_id: int,
+        msg_id: int,
+        emoji: Union[str, discord.PartialEmoji],
+        user_id: int,
+    ) -> None:
+        """
+        Queues the removal of a user's reaction.
+
+        Parameters
+        ----------
+        channel_id: int
+            The channel the msg is in
+        msg_id: int
+            The msg the reaction is on
+        emoji: Union[str, discord.PartialEmoji]
+            The emoji of the reaction
+        user_id: int
+            Whose reaction to remove
+        """
+        removal = (channel_id, msg_id, emoji_key(emoji), user_id)
+        if removal in self._queue:
+            return
+
+        self._queue[removal] = str(emoji)
+        self.stats["queued"] += 1
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._drain())
+
+    def discard(
+        self,
+        channel_id: int,
+        msg_id: int,
+        emoji: Union[str, discord.PartialEmoji],
+        user_id: int,
+    ) -> None:
+        """Drops a queued removal, i.e for a reaction the user re-added since."""
+        self._queue.pop((channel_id, msg_id, emoji_key(emoji), user_id), None)
+
+    def close(self) -> None:
+        if self._worker:
+            self._worker.cancel()
+            self._worker = None
+        self._queue.clear()
+
+    async def _drain(self) -> None:
+        while self._queue:
+            batch = []
+            for removal in self._queue:
+                batch.append(removal)
+                if len(batch) >= self.batch:
+                    break
+
+            for removal in batch:
+                await self._limiter.acquire()
+                # It may have been discarded while we waited
+                if removal not in self._queue:
+                    continue
+
+                channel_id, msg_id, _, user_id = removal
+                await self._remove(
+                    channel_id, msg_id, self._queue.pop(removal), user_id
+                )
+
+    async def _remove(
+        self, channel_id: int, msg_id: int, emoji: str, user_id: int
+    ) -> None:
+        channel = self.bot.get_channel(channel_id)
+        if channel is None:
+            return
+
+        try:
+            await channel.get_partial_message(msg_id).remove_reaction(
+                emoji, discord.Object(id=user_id)
+            )
+        except discord.HTTPException as e:
+            self.stats["failed"] += 1
+            log.debug("Failed to remove a reaction on %s: %s", msg_id, e)
+        else:
+            self.stats["removed"] += 1
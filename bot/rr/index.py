@@ -0,0 +1,80 @@
+from typing import Any, Dict, Iterable, Optional, Set, Union
+
+import discord
+
+
+def emoji_key(emoji: Union[str, discord.PartialEmoji, discord.Emoji]) -> str:
+    """
+    Returns the matching key for an emoji, the ID of a custom emoji
+    or the unicode emoji itself without variation selectors,
+    so "👍" and "👍️" (with U+FE0F) are the same reaction.
+    """
+    if isinstance(emoji, str):
+        emoji = discord.PartialEmoji.from_str(emoji.strip())
+
+    if emoji.id:
+        return str(emoji.id)
+    return emoji.name.replace("\ufe0f", "")
+
+
+def emoji_roles(data: Dict[str, Any]) -> Dict[str, int]:
+    """Maps the emoji keys of a reaction role msg to their role IDs."""
+    return {emoji_key(d["emoji"]): d["role_id"] for d in data["roles"]}
+
+
+class RRIndex:
+    """
+    Indexes reaction role msgs, from emoji to role per msg
+    and from guild to its msgs, so handling a reaction
+    or listing a guild's msgs is a dict lookup.
+    """
+
+    __slots__ = ("_roles", "_guilds")
+
+    def __init__(self):
+        self._roles: Dict[int, Dict[str, int]] = {}
+        self._guilds: Dict[int, Set[int]] = {}
+
+    def __contains__(self, msg_id: int) -> bool:
+        return msg_id in self._roles
+
+    def build(self, msgs: Iterable[Dict[str, Any]]) -> None:
+        self._roles.clear()
+        self._guilds.clear()
+        for msg in msgs:
+            self.add(msg)
+
+    def add(self, data: Dict[str, Any]) -> None:
+        """
+        (Re)indexes a reaction role msg.
+
+        Parameters
+        ----------
+        data: Dict[str, Any]
+            The reaction role msg, as stored
+        """
+        self._roles[data["_id"]] = emoji_roles(data)
+        self._guilds.setdefault(data["guild_id"], set()).add(data["_id"])
+
+    def remove(self, data: Dict[str, Any]) -> None:
+        self._roles.pop(data["_id"], None)
+        msgs = self._guilds.get(data["guild_id"])
+        if msgs is not None:
+            msgs.discard(data["_id"])
+            if not msgs:
+                del self._guilds[data["guild_id"]]
+
+    def get_role(
+        self, msg_id: int, emoji: Union[str, discord.PartialEmoji]
+    ) -> Optional[int]:
+        """
+        Returns the ID of the role bound to an emoji on a msg, if any.
+        """
+        roles = self._roles.get(msg_id)
+        return roles.get(emoji_key(emoji)) if roles else None
+
+    def guild_msgs(self, guild_id: int) -> Set[int]:
+        """
+        Returns the IDs of every reaction role msg in a guild.
+        """
+        return self._guilds.get(guild_id, set())
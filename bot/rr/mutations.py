@@ -0,0 +1,200 @@
+import asyncio
+import logging
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+import discord
+from aiolimiter import AsyncLimiter
+
+log = logging.getLogger(__name__)
+
+# The role IDs which were actually (added, removed)
+MutationResult = Tuple[Set[int], Set[int]]
+
+# normal: toggles, unique: one role per msg,
+# limit: at most N roles per msg, verify: roles are only ever added
+RR_MODES = ("normal", "unique", "limit", "verify")
+
+
+class PendingMutation:
+    __slots__ = ("member", "adds", "removes", "future", "task", "after")
+
+    def __init__(
+        self, member: discord.Member, after: Optional["PendingMutation"] = None
+    ):
+        self.member = member
+        self.adds: Set[int] = set()
+        self.removes: Set[int] = set()
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.task: Optional[asyncio.Task] = None
+        # The batch still being applied for the member, if any
+        self.after = after
+
+
+class RoleMutator:
+    """
+    Batches the role changes of a member.
+
+    Adds and removes queued for the same member within ``window``
+    seconds are folded together, the last one for a role wins, and
+    the net result is applied with a single ``member.edit`` call.
+    If the net result is what the member already has no call is made,
+    so flipping a reaction on and off costs nothing.
+
+    Parameters
+    ----------
+    window: float
+        Seconds to wait for more changes before applying them
+    guild_rate: Tuple[float, float]
+        Edits allowed per guild, as (amount, seconds)
+    """
+
+    __slots__ = (
+        "window",
+        "guild_rate",
+        "_pending",
+        "_applying",
+        "_limiters",
+        "_stats",
+    )
+
+    def __init__(
+        self, window: float = 0.75, guild_rate: Tuple[float, float] = (10, 10)
+    ):
+        self.window = window
+        self.guild_rate = guild_rate
+        self._pending: Dict[Tuple[int, int], PendingMutation] = {}
+        self._applying: Dict[Tuple[int, int], PendingMutation] = {}
+        self._limiters: Dict[int, AsyncLimiter] = {}
+        # queued changes, edits made, changes which were no-ops
+        self._stats: Dict[str, int] = {"queued": 0, "edits": 0, "skipped": 0}
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {**self._stats, "pending": len(self._pending)}
+
+    def queue(
+        self,
+        member: discord.Member,
+        add: Iterable[int] = (),
+        remove: Iterable[int] = (),
+    ) -> "asyncio.Future[MutationResult]":
+        """
+        Queue role changes for a member.
+
+        Parameters
+        ----------
+        member: discord.Member
+            Who to change the roles of
+        add: Iterable[int]
+            IDs of the roles to add
+        remove: Iterable[int]
+            IDs of the roles to remove
+
+        Returns
+        -------
+        asyncio.Future[MutationResult]
+            Resolves to the roles which were actually (added, removed)
+            once the batch is applied, shared by every change in the batch.
+            Raises discord.HTTPException if the edit failed
+        """
+        key = (member.guild.id, member.id)
+        pending = self._pending.get(key)
+        if pending is None:
+            pending = self._pending[key] = PendingMutation(
+                member, self._applying.get(key)
+            )
+            pending.task = asyncio.create_task(self._apply_later(key, pending))
+
+        for role_id in add:
+            pending.adds.add(role_id)
+            pending.removes.discard(role_id)
+        for role_id in remove:
+            pending.removes.add(role_id)
+            pending.adds.discard(role_id)
+
+        self._stats["queued"] += 1
+        return pending.future
+
+    def projected(self, member: discord.Member) -> Set[int]:
+        """
+        Returns the role IDs a member will have once
+        their queued changes are applied.
+        """
+        roles = {role.id for role in member.roles if not role.is_default()}
+        key = (member.guild.id, member.id)
+        for batch in (self._applying.get(key), self._pending.get(key)):
+            if batch is not None:
+                roles = (roles | batch.adds) - batch.removes
+        return roles
+
+    def close(self) -> None:
+        for pending in [*self._pending.values(), *self._applying.values()]:
+            if pending.task:
+                pending.task.cancel()
+            if not pending.future.done():
+                pending.future.cancel()
+        self._pending.clear()
+        self._applying.clear()
+        self._limiters.clear()
+
+    def _limiter(self, guild_id: int) -> AsyncLimiter:
+        limiter = self._limiters.get(guild_id)
+        if limiter is None:
+            limiter = self._limiters[guild_id] = AsyncLimiter(*self.guild_rate)
+        return limiter
+
+    async def _apply_later(self, key: Tuple[int, int], pending: PendingMutation) -> None:
+        await asyncio.sleep(self.window)
+
+        # Batches of a member are applied in order, each
+        # starting from the roles the previous one set
+        previous = pending.after
+        pending.after = None
+        if previous is not None:
+            await asyncio.wait([previous.future])
+            pending.member = previous.member
+
+        await self._limiter(key[0]).acquire()
+
+        # Changes queued from here on start a new batch
+        if self._pending.get(key) is pending:
+            del self._pending[key]
+        self._applying[key] = pending
+
+        try:
+            result = await self._apply(pending)
+        except Exception as e:
+            if not pending.future.done():
+                pending.future.set_exception(e)
+                # Nobody may be waiting on it, don't warn about it never being retrieved
+                pending.future.exception()
+            log.debug("Failed to edit the roles of %s: %s", pending.member, e)
+        else:
+            if not pending.future.done():
+                pending.future.set_result(result)
+        finally:
+            if self._applying.get(key) is pending:
+                del self._applying[key]
+
+    async def _apply(self, pending: PendingMutation) -> MutationResult:
+        member = pending.member
+        current = {role.id for role in member.roles if not role.is_default()}
+        added = pending.adds - current
+        removed = pending.removes & current
+        if not added and not removed:
+            self._stats["skipped"] += 1
+            return added, removed
+
+        roles = (current | added) - removed
+        edited = await member.edit(
+            roles=[discord.Object(id=role_id) for role_id in roles],
+            reason="Reaction roles",
+        )
+        self._stats["edits"] += 1
+        if edited is not None:
+            pending.member = edited
+
+        return added, removed
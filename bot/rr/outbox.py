@@ -0,0 +1,148 @@
+import asyncio
+import logging
+from datetime import timedelta
+from typing import Dict, List, Tuple
+
+import discord
+
+from bot.cache import TimedCache
+
+log = logging.getLogger(__name__)
+
+
+class DMOutbox:
+    """
+    A bounded queue of DMs, sent by a small pool of workers
+    so event handlers never wait on a DM.
+
+    The same DM to the same user within ``dedupe_window`` is only sent
+    once, and users whose DMs are closed are remembered for ``closed_ttl``
+    so we don't keep hitting 403s. Once the outbox is full new DMs
+    are dropped and counted rather than queued.
+
+    Parameters
+    ----------
+    max_size: int
+        How many DMs can be waiting
+    workers: int
+        How many DMs are sent at once
+    dedupe_window: timedelta
+        How long an identical DM to a user is ignored for
+    closed_ttl: timedelta
+        How long a user with closed DMs is skipped for
+    """
+
+    __slots__ = (
+        "workers",
+        "dedupe_window",
+        "closed_ttl",
+        "_queue",
+        "_workers",
+        "recent",
+        "closed",
+        "stats",
+    )
+
+    def __init__(
+        self,
+        max_size: int = 1000,
+        workers: int = 3,
+        dedupe_window: timedelta = timedelta(seconds=30),
+        closed_ttl: timedelta = timedelta(hours=6),
+    ):
+        self.workers = workers
+        self.dedupe_window = dedupe_window
+        self.closed_ttl = closed_ttl
+        self._queue: "asyncio.Queue[Tuple[discord.abc.User, str]]" = asyncio.Queue(
+            max_size
+        )
+        self._workers: List[asyncio.Task] = []
+        # (user_id, content) of recently queued DMs
+        self.recent = TimedCache(max_size=max_size * 10)
+        # IDs of users whose DMs are closed
+        self.closed = TimedCache(max_size=50_000)
+        self.stats: Dict[str, int] = {
+            "queued": 0,
+            "sent": 0,
+            "deduped": 0,
+            "closed": 0,
+            "dropped": 0,
+            "failed": 0,
+        }
+
+    def __len__(self) -> int:
+        return self._queue.qsize()
+
+    def put(self, user: discord.abc.User, content: str) -> bool:
+        """
+        Queues a DM.
+
+        Parameters
+        ----------
+        user: discord.abc.User
+            Who to DM
+        content: str
+            What to send
+
+        Returns
+        -------
+        bool
+            Whether it was queued, False if it was a duplicate,
+            the user's DMs are closed or the outbox is full
+        """
+        if user.id in self.closed:
+            self.stats["closed"] += 1
+            return False
+
+        key = (user.id, content)
+        if key in self.recent:
+            self.stats["deduped"] += 1
+            return False
+
+        try:
+            self._queue.put_nowait((user, content))
+        except asyncio.QueueFull:
+            self.stats["dropped"] += 1
+            return False
+
+        self.recent.add_entry(key, None, ttl=self.dedupe_window, override=True)
+        self.stats["queued"] += 1
+        self._start()
+        return True
+
+    def close(self) -> None:
+        for worker in self._workers:
+            worker.cancel()
+        self._workers.clear()
+
+    def _start(self) -> None:
+        if self._workers:
+            return
+
+        self._workers = [
+            asyncio.create_task(self._work()) for _ in range(self.workers)
+        ]
+
+    async def _work(self) -> None:
+        while True:
+            user, content = await self._queue.get()
+            try:
+                await self._send(user, content)
+            finally:
+                self._queue.task_done()
+
+    async def _send(self, user: discord.abc.User, content: str) -> None:
+        if user.id in self.closed:
+            self.stats["closed"] += 1
+            return
+
+        try:
+            await user.send(content)
+        except discord.Forbidden:
+            self.stats["closed"] += 1
+            self.closed.add_entry(user.id, None, ttl=self.closed_ttl, override=True)
+        except discord.HTTPException as e:
+            self.stats["failed"] += 1
+            log.debug("Failed to DM %s: %s", user.id, e)
+        else:
+            self.stats["sent"] += 1
@@ -0,0 +1,310 @@
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import discord
+from aiolimiter import AsyncLimiter
+
+from bot.rr.index import emoji_key, emoji_roles
+
+log = logging.getLogger(__name__)
+
+
+def reconcile_roles(
+    data: Dict[str, Any], held: Set[int], reacted: List[int], prune: bool = False
+) -> Tuple[Set[int], Set[int], List[int]]:
+    """
+    Works out what a member's reactions on a msg amount to under its mode,
+    the same way the live reaction events would have.
+
+    Parameters
+    ----------
+    data: Dict[str, Any]
+        The reaction role msg
+    held: Set[int]
+        The roles of the msg the member has
+    reacted: List[int]
+        The roles of the msg the member reacted for, in the order of the
+        msg's reactions. When a member's reactions can't all be honoured,
+        i.e on unique/limit msgs, the earlier emojis win. The order the
+        member reacted in isn't known after the fact
+    prune: bool
+        Whether to remove held roles the member isn't reacting for
+
+    Returns
+    -------
+    Tuple[Set[int], Set[int], List[int]]
+        The roles to add, the roles to remove and the roles
+        whose reactions should be removed
+    """
+    mode = data.get("mode", "normal")
+    wanted = set(reacted)
+
+    if mode == "verify":
+        return wanted - held, set(), []
+
+    remove = held - wanted if prune else set()
+    if mode == "unique":
+        if not reacted:
+            return set(), remove, []
+
+        # Keep a role they already have over handing out another
+        keep = next((role_id for role_id in reacted if role_id in held), reacted[0])
+        add = {keep} - held
+        if add:
+            remove |= held - {keep}
+        return add, remove, [role_id for role_id in reacted if role_id != keep]
+
+    if mode == "limit":
+        room = max(data.get("limit", 1) - len(held - remove), 0)
+        new = [role_id for role_id in reacted if role_id not in held]
+        return set(new[:room]), remove, new[room:]
+
+    return wanted - held, remove, []
+
+
+class Reconciler:
+    """
+    Brings reaction roles back in sync with the reactions on their msgs,
+    for reactions added/removed while the bot was offline.
+
+    Runs in the background, a few msgs at a time, with every REST call
+    going through one token bucket. What a member's reactions amount to
+    follows the msg's mode like live ones, see reconcile_roles, and the
+    role changes go through the manager's RoleMutator so they're batched
+    per member too.
+
+    Parameters
+    ----------
+    manager: ReactionRolesManager
+        The manager whose msgs to reconcile
+    concurrency: int
+        How many msgs to reconcile at once
+    rest_rate: Tuple[float, float]
+        REST calls allowed, as (amount, seconds)
+    prune: bool
+        Whether to also remove the roles of members who aren't reacting.
+        Off by default: which reactions went away while offline isn't
+        known, so this takes the role from every holder not reacting,
+        including members who got it some other way
+
+    Notes
+    -----
+    Role holders come from the gateway cache, so without
+    the members intent pruning only sees cached members.
+    """
+
+    __slots__ = ("manager", "concurrency", "prune", "_limiter", "_task", "stats")
+
+    def __init__(
+        self,
+        manager,
+        concurrency: int = 2,
+        rest_rate: Tuple[float, float] = (5, 1),
+        prune: bool = False,
+    ):
+        self.manager = manager
+        self.concurrency = concurrency
+        self.prune = prune
+        self._limiter = AsyncLimiter(*rest_rate)
+        self._task: Optional[asyncio.Task] = None
+        self.stats: Dict[str, int] = {"msgs": 0, "added": 0, "removed": 0}
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        """Starts a pass in the background, unless one is already running."""
+        if self.running:
+            return
+
+        self._task = asyncio.create_task(self.run())
+        self._task.add_done_callback(self._done)
+
+    def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def run(self) -> None:
+        """Reconciles every cached reaction role msg."""
+        # A snapshot, msgs may be added/removed while this runs
+        msgs = iter(
+            [
+                data
+                for data in self.manager.reaction_roles.values()
+                if data["is_enabled"] and data["roles"]
+            ]
+        )
+
+        async def worker() -> None:
+            for data in msgs:
+                try:
+                    await self.reconcile_msg(data)
+                except discord.HTTPException as e:
+                    log.debug(
+                        "Failed to reconcile reaction roles on %s: %s", data["_id"], e
+                    )
+
+        await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+
+    async def reconcile_msg(self, data: Dict[str, Any]) -> None:
+        """
+        Reconciles the roles of one reaction role msg.
+
+        Parameters
+        ----------
+        data: Dict[str, Any]
+            The reaction role msg
+        """
+        fetched = await self._fetch_msg(data)
+        if fetched is None:
+            return
+
+        guild, msg = fetched
+        holders, reacted, emojis = await self._collect(guild, msg, emoji_roles(data))
+        changes = self._diff(data, msg, holders, reacted, emojis)
+        await self._apply(guild, changes)
+        self.stats["msgs"] += 1
+
+    async def _fetch_msg(
+        self, data: Dict[str, Any]
+    ) -> Optional[Tuple[discord.Guild, discord.Message]]:
+        guild = self.manager.bot.get_guild(data["guild_id"])
+        if guild is None:
+            return None
+
+        channel = guild.get_channel(data.get("channel_id"))
+        if channel is None:
+            return None
+
+        await self._limiter.acquire()
+        try:
+            return guild, await channel.fetch_message(data["_id"])
+        except discord.NotFound:
+            return None
+
+    async def _collect(
+        self, guild: discord.Guild, msg: discord.Message, roles: Dict[str, int]
+    ) -> Tuple[Dict[int, Set[int]], Dict[int, List[int]], Dict[int, Any]]:
+        """
+        Returns
+        -------
+        Tuple[Dict[int, Set[int]], Dict[int, List[int]], Dict[int, Any]]
+            The members holding each role, the roles each member reacted for
+            in the order of the msg's reactions, and the emoji of each role
+        """
+        holders: Dict[int, Set[int]] = {}
+        reacted: Dict[int, List[int]] = {}
+        emojis: Dict[int, Any] = {}
+        for reaction in msg.reactions:
+            role_id = roles.get(emoji_key(reaction.emoji))
+            role = guild.get_role(role_id) if role_id else None
+            if role is None:
+                continue
+
+            holders[role_id] = {member.id for member in role.members}
+            emojis[role_id] = reaction.emoji
+            for user_id in await self._reactors(reaction, self.manager.bot.user.id):
+                reacted.setdefault(user_id, []).append(role_id)
+
+        if self.prune:
+            # Roles bound to emojis nobody reacted with anymore
+            for role_id in set(roles.values()) - holders.keys():
+                role = guild.get_role(role_id)
+                if role is not None:
+                    holders[role_id] = {member.id for member in role.members}
+
+        return holders, reacted, emojis
+
+    def _diff(
+        self,
+        data: Dict[str, Any],
+        msg: discord.Message,
+        holders: Dict[int, Set[int]],
+        reacted: Dict[int, List[int]],
+        emojis: Dict[int, Any],
+    ) -> Dict[int, Tuple[Set[int], Set[int]]]:
+        """
+        Works out the role changes of every member, queuing the removal
+        of reactions over the msg's limit like live reactions do.
+
+        Returns
+        -------
+        Dict[int, Tuple[Set[int], Set[int]]]
+            Member ID -> (roles to add, roles to remove)
+        """
+        held: Dict[int, Set[int]] = {}
+        for role_id, members in holders.items():
+            for user_id in members:
+                held.setdefault(user_id, set()).add(role_id)
+
+        users = set(reacted)
+        if self.prune:
+            users.update(held)
+
+        changes: Dict[int, Tuple[Set[int], Set[int]]] = {}
+        for user_id in users:
+            add, remove, unreact = reconcile_roles(
+                data, held.get(user_id, set()), reacted.get(user_id, []), self.prune
+            )
+            for role_id in unreact:
+                self.manager.cleanup.remove(
+                    msg.channel.id, msg.id, emojis[role_id], user_id
+                )
+            if add or remove:
+                changes[user_id] = (add, remove)
+
+        return changes
+
+    async def _apply(
+        self, guild: discord.Guild, changes: Dict[int, Tuple[Set[int], Set[int]]]
+    ) -> None:
+        pending = []
+        for user_id, (add, remove) in changes.items():
+            member = guild.get_member(user_id)
+            if member is None:
+                await self._limiter.acquire()
+                member = await self.manager.resolve_member(guild, user_id)
+                if member is None:
+                    continue
+
+            pending.append(self.manager.mutations.queue(member, add=add, remove=remove))
+
+        for result in await asyncio.gather(*pending, return_exceptions=True):
+            if isinstance(result, BaseException):
+                continue
+            added, removed = result
+            self.stats["added"] += len(added)
+            self.stats["removed"] += len(removed)
+
+    async def _reactors(self, reaction: discord.Reaction, bot_id: int) -> Set[int]:
+        """The IDs of everyone who reacted, a page of 100 per REST call."""
+        users: Set[int] = set()
+        after = None
+        while True:
+            await self._limiter.acquire()
+            page = [user async for user in reaction.users(limit=100, after=after)]
+            users.update(user.id for user in page)
+            if len(page) < 100:
+                break
+            after = page[-1]
+
+        users.discard(bot_id)
+        return users
+
+    def _done(self, task: asyncio.Task) -> None:
+        if task.cancelled():
+            return
+
+        exc = task.exception()
+        if exc:
+            log.warning("Reaction role reconciliation failed", exc_info=exc)
+        else:
+            log.info(
+                "Reconciled %s reaction role msgs, %s roles added, %s removed",
+                self.stats["msgs"],
+                self.stats["added"],
+                self.stats["removed"],
+            )
@@ -14,6 +14,8 @@ Jihye = BaseBot(
     intents=discord.Intents.all(),
     mongo_url=os.getenv("MONGO_URL"),
     db_name=os.getenv("DB_NAME", "rewrite"),
+    # Seconds to buffer db upserts for, unset writes straight away
+    db_write_behind=float(os.getenv("DB_WRITE_BEHIND", 0)) or None,
     reload=True,
     test_guilds=[923592895162884118],
 )
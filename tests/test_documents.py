@@ -0,0 +1,82 @@
+import asyncio
+
+from bot.db.documents import Document
+
+
+class SlowCollection:
+    """Records bulk writes, each taking a while."""
+
+    def __init__(self):
+        self.written = []
+
+    async def bulk_write(self, ops, ordered=True):
+        await asyncio.sleep(0.05)
+        self.written.extend(ops)
+
+
+def test_close_waits_on_an_in_flight_flush():
+    async def main():
+        collection = SlowCollection()
+        doc = Document({"docs": collection}, "docs", write_behind=0.01)
+
+        await doc.upsert({"_id": 1, "a": 1})
+        # Let the periodic flush start its write
+        await asyncio.sleep(0.03)
+        await doc.upsert({"_id": 2, "b": 2})
+        await doc.close()
+
+        return collection.written, doc.get_write_stats()
+
+    written, stats = asyncio.run(main())
+    assert [op._filter for op in written] == [{"_id": 1}, {"_id": 2}]
+    assert stats.pending == 0
+    assert stats.failed == 0
+
+
+def test_cancelled_flush_requeues_its_writes():
+    async def main():
+        collection = SlowCollection()
+        doc = Document({"docs": collection}, "docs", write_behind=60)
+
+        await doc.upsert({"_id": 1, "a": 1})
+        flush = asyncio.create_task(doc.flush())
+        await asyncio.sleep(0.01)
+        flush.cancel()
+        await asyncio.gather(flush, return_exceptions=True)
+
+        pending = doc.get_write_stats().pending
+        await doc.close()
+        return pending, collection.written
+
+    pending, written = asyncio.run(main())
+    assert pending == 1
+    assert [op._filter for op in written] == [{"_id": 1}]
+
+
+class RecordingCollection:
+    def __init__(self):
+        self.updates = []
+
+    async def update_one(self, filter_dict, update, upsert=False):
+        self.updates.append(update)
+        return type("UpdateResult", (), {"matched_count": 1, "upserted_id": None})
+
+
+def test_array_updates_never_set_the_version():
+    async def main():
+        collection = RecordingCollection()
+        doc = Document({"docs": collection}, "docs")
+        await doc.push(
+            1,
+            "roles",
+            {"emoji": "x", "role_id": 2},
+            upsert=True,
+            set_fields={"channel_id": 3, Document.VERSION_FIELD: 4},
+            set_on_insert={"guild_id": 5, Document.VERSION_FIELD: 4},
+        )
+        return collection.updates[0]
+
+    update = asyncio.run(main())
+    assert update["$set"] == {"channel_id": 3}
+    assert update["$setOnInsert"] == {"guild_id": 5}
+    assert update["$inc"] == {Document.VERSION_FIELD: 1}
@@ -0,0 +1,100 @@
+import asyncio
+import time
+
+import pytest
+
+from bot.ar.matcher import PatternMatcher, validate_pattern
+from bot.exceptions import InvalidPattern
+
+
+# Backtracks 2**26 ways at every position before the "b"
+EVIL = "a" * 26 + "xb"
+
+
+def ar(trigger, match="regex", **fields):
+    return {"trigger": trigger, "response": "hi", "match": match, **fields}
+
+
+def test_backtracking_regex_does_not_stall_the_loop():
+    async def main():
+        matcher = PatternMatcher(timeout=0.05)
+        matcher.build(1, [ar("(a|a)*b")])
+
+        gaps = []
+
+        async def heartbeat():
+            last = time.perf_counter()
+            while True:
+                await asyncio.sleep(0.01)
+                now = time.perf_counter()
+                gaps.append(now - last)
+                last = now
+
+        beat = asyncio.create_task(heartbeat())
+        try:
+            start = time.perf_counter()
+            assert await matcher.match(1, EVIL) is None
+            elapsed = time.perf_counter() - start
+            assert 1 in matcher._disabled
+        finally:
+            beat.cancel()
+            matcher.close()
+
+        return elapsed, max(gaps, default=0)
+
+    elapsed, gap = asyncio.run(main())
+    assert elapsed < 1
+    assert gap < 0.5
+
+
+def test_timed_out_guild_is_disabled_until_its_ars_change():
+    async def main():
+        matcher = PatternMatcher(timeout=0.05)
+        matcher.build(1, [ar("(a|a)*b")])
+        try:
+            await matcher.match(1, EVIL)
+            assert 1 in matcher._disabled
+
+            matcher.add(1, ar("hello"))
+            assert 1 not in matcher._disabled
+            assert (await matcher.match(1, "hello"))["trigger"] == "hello"
+        finally:
+            matcher.close()
+
+    asyncio.run(main())
+
+
+@pytest.mark.parametrize(
+    "trigger", ["(?i)hello", "hi(?i)", "(?P<name>a)", r"(a)\1", "(a+)+", "("]
+)
+def test_invalid_regexes_are_rejected(trigger):
+    with pytest.raises(InvalidPattern):
+        validate_pattern("regex", trigger)
+
+
+@pytest.mark.parametrize("ignore_case", [False, True])
+def test_valid_regexes_pass(ignore_case):
+    validate_pattern("regex", "(?i:hello) there", ignore_case)
+    validate_pattern("glob", "he*o", ignore_case)
+
+
+def test_bad_trigger_only_disables_itself():
+    async def main():
+        matcher = PatternMatcher()
+        # i.e saved before validation rejected it
+        matcher.build(
+            1,
+            [
+                ar("(?i)hello"),
+                ar("wor+ld"),
+                ar("sp?m*", match="glob", **{"ignore_case?": True}),
+            ],
+        )
+        try:
+            assert (await matcher.match(1, "hello world"))["trigger"] == "wor+ld"
+            assert (await matcher.match(1, "SPAM"))["trigger"] == "sp?m*"
+            assert await matcher.match(1, "hello") is None
+        finally:
+            matcher.close()
+
+    asyncio.run(main())
@@ -0,0 +1,47 @@
+import pytest
+
+from bot.rr.reconcile import reconcile_roles
+
+
+def msg(mode="normal", limit=1):
+    return {"mode": mode, "limit": limit}
+
+
+@pytest.mark.parametrize("prune", [False, True])
+def test_normal_adds_reacted_roles(prune):
+    add, remove, unreact = reconcile_roles(msg(), {1}, [1, 2], prune)
+    assert (add, remove, unreact) == ({2}, set(), [])
+
+
+def test_pruning_is_opt_in():
+    assert reconcile_roles(msg(), {1, 2}, [1]) == (set(), set(), [])
+    assert reconcile_roles(msg(), {1, 2}, [1], prune=True) == (set(), {2}, [])
+
+
+def test_verify_never_removes():
+    assert reconcile_roles(msg("verify"), {1}, [2], prune=True) == ({2}, set(), [])
+
+
+def test_unique_gives_one_role_and_takes_the_other_reactions_off():
+    add, remove, unreact = reconcile_roles(msg("unique"), set(), [1, 2])
+    assert (add, remove, unreact) == ({1}, set(), [2])
+
+
+def test_unique_keeps_the_role_already_held():
+    add, remove, unreact = reconcile_roles(msg("unique"), {2}, [1, 2])
+    assert (add, remove, unreact) == (set(), set(), [1])
+
+
+def test_unique_swaps_roles_like_a_live_reaction():
+    add, remove, unreact = reconcile_roles(msg("unique"), {3}, [1])
+    assert (add, remove, unreact) == ({1}, {3}, [])
+
+
+def test_limit_only_fills_the_room_left():
+    add, remove, unreact = reconcile_roles(msg("limit", 2), {1}, [1, 2, 3])
+    assert (add, remove, unreact) == ({2}, set(), [3])
+
+
+def test_limit_counts_pruned_roles_as_room():
+    add, remove, unreact = reconcile_roles(msg("limit", 1), {1}, [2], prune=True)
+    assert (add, remove, unreact) == ({2}, {1}, [])
@@ -0,0 +1,27 @@
+from types import SimpleNamespace
+
+from bot.ar.responses import ResponseCache
+from bot.ar.variables import MemberCounter, TemplateVariables
+
+GUILD = SimpleNamespace(id=1, name="guild")
+
+
+def test_rendered_responses_are_cached():
+    responses = ResponseCache()
+    members = MemberCounter()
+    variables = TemplateVariables(None, members)
+    variables.values["guild_name"] = GUILD.name
+
+    responses.put(GUILD, "hi", variables, content="hi from guild")
+    assert responses.get(GUILD, "hi", members).content == "hi from guild"
+
+
+def test_fallback_responses_are_not_cached():
+    responses = ResponseCache()
+    members = MemberCounter()
+    variables = TemplateVariables(None, members)
+    variables.cacheable = False
+
+    response = responses.put(GUILD, "hi", variables, content="{{ guild_name }}")
+    assert response.content == "{{ guild_name }}"
+    assert responses.get(GUILD, "hi", members) is None
@@ -0,0 +1,76 @@
+import time
+
+import pytest
+
+from bot.ar.sandbox import GuardedEnvironment, RenderLimitExceeded
+
+
+@pytest.fixture
+def env():
+    return GuardedEnvironment()
+
+
+def render(env, source):
+    return env.render(env.from_string(source), {})
+
+
+@pytest.mark.parametrize(
+    "source",
+    [
+        "{{ ((((9**99)**99)**99)**99) > 1 }}",
+        "{{ 2**5000 }}",
+        "{% set ns = namespace(a=3**100) %}"
+        "{% for i in range(20) %}{% set ns.a = ns.a * ns.a %}{% endfor %}"
+        "{{ ns.a > 1 }}",
+        "{{ 'a' * 10**6 }}",
+        "{{ '%0999999999d' % 1 }}",
+        "{{ '%(x)999999999s' % {'x': 1} }}",
+        "{{ '%*d' % (999999999, 1) }}",
+        "{{ lipsum(200000) }}",
+        "{{ 'x'|center(300000000) }}",
+        "{{ 'x'.ljust(300000000) }}",
+        "{{ 'x'.zfill(300000000) }}",
+        "{{ '{:>300000000}'.format(1) }}",
+        "{{ '{:>{}}'.format(1, 300000000) }}",
+        "{{ 'x'|indent(300000000, true) }}",
+        "{{ 'a'|replace('', 'b' * 4000) }}",
+        "{{ [1]|batch(300000000, 0)|list }}",
+        "{{ [1]|slice(300000000)|list }}",
+        "{% set ns = namespace(a='ab') %}"
+        "{% for i in range(20) %}{% set ns.a = ns.a ~ ns.a %}{% endfor %}",
+        "{% set ns = namespace(a='ab') %}"
+        "{% for i in range(20) %}{% set ns.a = ns.a + ns.a %}{% endfor %}",
+        "{% set ns = namespace(a='ab') %}"
+        "{% for i in range(20) %}{% set ns.a = [ns.a, ns.a]|join %}{% endfor %}",
+        "{% set l = [1] %}{% for i in range(20) %}{{ l.extend(l) }}{% endfor %}",
+    ],
+)
+def test_huge_values_are_rejected_before_computing(env, source):
+    start = time.perf_counter()
+    with pytest.raises(RenderLimitExceeded):
+        render(env, source)
+    assert time.perf_counter() - start < 1
+
+
+@pytest.mark.parametrize(
+    "source, expected",
+    [
+        ("{{ 2**10 }}", "1024"),
+        ("{{ 1**10**9 }}", "1"),
+        ("{{ 12 * 12 }}", "144"),
+        ("{{ 'ab' * 3 }}", "ababab"),
+        ("{{ 7 % 3 }}", "1"),
+        ("{{ '%5d|%%|%.2f' % (3, 1.5) }}", "    3|%|1.50"),
+        ("{{ 'x'|center(5) }}", "  x  "),
+        ("{{ '{:>3}'.format(1) }}", "  1"),
+        ("{{ 'a' ~ 'b' + 'c' }}", "abc"),
+        ("{{ [1, 2, 3]|batch(2)|list }}", "[[1, 2], [3]]"),
+        ("{{ 'a b'|replace(' ', '-') }}", "a-b"),
+    ],
+)
+def test_small_values_render(env, source, expected):
+    assert render(env, source) == expected
+
+
+def test_lipsum_is_capped_not_removed(env):
+    assert render(env, "{{ lipsum(1, html=false, min=5, max=10) }}")
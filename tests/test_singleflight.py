@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+
+from bot.cache import TimedCache
+from bot.cache.singleflight import SingleFlight
+
+
+def test_loads_are_coalesced():
+    async def main():
+        flights = SingleFlight()
+        calls = 0
+
+        async def loader():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return "value"
+
+        results = await asyncio.gather(*(flights.do("key", loader) for _ in range(5)))
+        return results, calls, "key" in flights
+
+    results, calls, in_flight = asyncio.run(main())
+    assert results == ["value"] * 5
+    assert calls == 1
+    assert not in_flight
+
+
+def test_cancelled_first_caller_does_not_cancel_the_others():
+    async def main():
+        cache = TimedCache()
+        calls = 0
+
+        async def loader():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.05)
+            return "value"
+
+        first = asyncio.create_task(cache.get_or_load("key", loader))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(cache.get_or_load("key", loader))
+        await asyncio.sleep(0)
+
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+
+        return await second, calls, cache.get_entry("key")
+
+    assert asyncio.run(main()) == ("value", 1, "value")
+
+
+def test_errors_reach_every_caller():
+    async def main():
+        flights = SingleFlight()
+
+        async def loader():
+            await asyncio.sleep(0.01)
+            raise ValueError("nope")
+
+        return await asyncio.gather(
+            *(flights.do("key", loader) for _ in range(3)), return_exceptions=True
+        )
+
+    assert all(isinstance(result, ValueError) for result in asyncio.run(main()))
@@ -0,0 +1,40 @@
+import pytest
+
+from bot.ar.sandbox import GuardedEnvironment
+from bot.ar.templates import TemplateCache
+
+
+@pytest.fixture
+def templates():
+    return TemplateCache(GuardedEnvironment())
+
+
+@pytest.mark.parametrize(
+    "source, expensive",
+    [
+        ("{{ user }}", False),
+        ("{{ user|upper }}", False),
+        ("{% for i in range(3) %}{{ i }}{% endfor %}", True),
+        ("{{ lipsum(1) }}", True),
+        ("{{ 'x'|center(5) }}", True),
+        ("{{ 'x'.ljust(5) }}", True),
+        ("{{ '{}'.format(1) }}", True),
+        ("{% filter indent(2) %}x{% endfilter %}", True),
+    ],
+)
+def test_heavy_calls_are_expensive(templates, source, expensive):
+    assert templates.get(1, "hi", "response", source).expensive is expensive
+
+
+@pytest.mark.parametrize(
+    "source, deterministic",
+    [
+        ("{{ guild_name }}", True),
+        ("{{ ['heads', 'tails']|random }}", False),
+        ("{{ lipsum(1) }}", False),
+        ("{% set c = cycler('a', 'b') %}{{ c.next() }}", False),
+        ("{% set j = joiner() %}{{ j() }}", False),
+    ],
+)
+def test_random_templates_are_not_deterministic(templates, source, deterministic):
+    assert templates.get(1, "hi", "response", source).deterministic is deterministic